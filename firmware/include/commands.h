@@ -7,6 +7,7 @@ enum device_command {
     DEV_CMD_LOAD_CFG = 0x70,
     DEV_CMD_MEASURE = 0x7A,
     DEV_CMD_LOAD_DATA = 0x7F,
+    DEV_CMD_CRC_DATA = 0x7C,
     DEV_CMD_SAVE_CFG = 0x80,
 };
 
@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import itertools
+import argparse
+import typing
+import numpy as np
+
+import kalman_fixed
+
+# The host tools at the top of the repository read configs and logs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from nanodeploy import DeviceID, Config, log_rate, launch_pages, mem_per_packet
+import nanodeploy_image
+
+# Replays altitude streams through a model of flight_step in
+# src/flight_logic.c: calibration, the generated fixed-point Kalman filter (see
+# kalman_fixed.py) and the state machine, with the same integer types. It runs
+# every flight against every parameter set at once, so deployment timing can be
+# checked over thousands of flights x parameter variants before flying.
+#
+# Input is what atm_pressure_alt returns once per tick: altitude (m) as a
+# uint16, 0 at or below base pressure. Logging isn't modelled; it doesn't
+# affect the state machine.
+
+STATE_CALIB, STATE_READY, STATE_PROG, STATE_BOOST, STATE_COAST, \
+    STATE_DESCENT, STATE_MAIN, STATE_LANDED = range(8)
+# Samples averaged for the ground altitude, as NUM_CALIB_CYCLES
+num_calib_cycles = 40
+tick_rate = log_rate
+
+# struct parameters from include/params.h
+params_dtype = np.dtype([
+    ("owi_id", "u1", 8),
+    ("fd_boost", "u1"), ("fd_coast", "u1"), ("fd_descent", "u1"), ("fd_main", "u1"),
+    ("alt_main", "<u2"), ("dur_drogue", "u1"), ("dur_main", "u1"),
+    ("t_boost", "u1"), ("t_coast", "u1"), ("t_descent", "u1"), ("t_main", "u1"),
+    ("t_land", "u1"), ("res_3", "u1"), ("rate_liftoff", "u1"), ("rate_land", "u1"),
+    ("res_4", "u1", 4), ("base_pres", "<u4"),
+    ("res_5", "u1", 8), ("res_6", "u1", 8),
+    ("name", "S15"), ("crc", "u1"),
+])
+
+# Parameter sets as the firmware sees them, from Configs or raw config bytes.
+# Fields Config doesn't set (e.g. alt_main) are zero; set them in the result.
+def make_params(configs: list[Config | bytes]) -> np.ndarray:
+    data = b"".join(bytes(config) for config in configs)
+    return np.frombuffer(data, dtype=params_dtype).copy()
+
+# States reported by replay, and the result field each is reported in
+replay_states = {
+    STATE_READY: "ready",
+    STATE_BOOST: "boost",
+    STATE_COAST: "coast",
+    STATE_DESCENT: "descent",
+    STATE_MAIN: "main",
+    STATE_LANDED: "landed",
+}
+
+# Time (s since the first sample) each state was entered, NaN if never, and
+# the calibrated ground altitude
+replay_dtype = np.dtype([(name, "f8") for name in replay_states.values()]
+                        + [("ground_alt", "u2")])
+
+# For each active state: the params field that reloads state_counter while the
+# state's hold condition is true, the next state, and the params field that
+# loads state_counter on moving to it (None leaves it as it is)
+transitions = {
+    STATE_READY: ("t_boost", STATE_BOOST, "t_coast"),
+    STATE_BOOST: ("t_coast", STATE_COAST, "t_descent"),
+    STATE_COAST: ("t_coast", STATE_DESCENT, "t_main"),
+    STATE_DESCENT: ("t_descent", STATE_MAIN, "t_land"),
+    STATE_MAIN: ("t_main", STATE_LANDED, None),
+}
+
+# Runs flights (each a sequence of per-tick altitudes) against every parameter
+# set in params (see make_params). Returns replay_dtype results shaped
+# (parameter sets, flights), and with trace, also the state after every tick
+# shaped (parameter sets, flights, ticks).
+def replay(flights: list[typing.Any], params: np.ndarray, trace: bool = False):
+    params = np.atleast_1d(params)
+    lengths = np.asarray([len(f) for f in flights])
+    alt = np.zeros((len(flights), max(lengths, default=0)), dtype=np.uint16)
+    for i, f in enumerate(flights):
+        alt[i, :len(f)] = np.clip(np.asarray(f), 0, 0xFFFF)
+    ticks = alt.shape[1]
+    out = np.zeros((len(params), len(flights)), dtype=replay_dtype)
+    for name in replay_states.values():
+        out[name] = np.nan
+    states = np.zeros((len(params), len(flights), ticks), dtype=np.uint8) if trace else None
+    if ticks < num_calib_cycles:
+        return (out, states) if trace else out
+
+    # Calibration doesn't depend on the parameters
+    ground_alt = (np.sum(alt[:, :num_calib_cycles], axis=1, dtype=np.uint32)
+                  // num_calib_cycles).astype(np.uint16)
+    out["ground_alt"] = ground_alt
+    out["ready"][:, lengths >= num_calib_cycles] = (num_calib_cycles - 1) / tick_rate
+
+    # Per-state lookup tables, (parameter sets, states)
+    reload = np.zeros((len(params), 8), dtype=np.uint8)
+    load = np.zeros((len(params), 8), dtype=np.uint8)
+    next_state = np.arange(8, dtype=np.uint8)
+    for state, (hold_field, nxt, next_field) in transitions.items():
+        reload[:, state] = params[hold_field]
+        next_state[state] = nxt
+        if next_field is not None:
+            load[:, state] = params[next_field]
+    rate_liftoff = params["rate_liftoff"].astype(np.int32)[:, None] * 16
+    rate_land = params["rate_land"].astype(np.int16)[:, None]
+    alt_main = params["alt_main"][:, None]
+    rows = np.arange(len(params))[:, None]
+
+    state = np.full((len(params), len(flights)), STATE_READY, dtype=np.uint8)
+    counter = np.repeat(params["t_boost"][:, None], len(flights), axis=1)
+    x = np.zeros((len(flights), 3), dtype=np.int16)
+    if trace:
+        states[:, :, :num_calib_cycles - 1] = STATE_CALIB
+        states[:, :, num_calib_cycles - 1] = STATE_READY
+    for n in range(num_calib_cycles, ticks):
+        zk = (alt[:, n] - ground_alt).view(np.int16)
+        x = kalman_fixed.update_kalman(x, zk)
+        v = x[:, 1]
+        counter -= 1
+        hold = np.select(
+            [state == STATE_READY, state == STATE_BOOST, state == STATE_COAST,
+             state == STATE_DESCENT, state == STATE_MAIN],
+            [v <= rate_liftoff, (v <= 0) | (x[:, 2] >= 0), v >= 0,
+             x[:, 0].view(np.uint16) >= alt_main, np.abs(v) >= rate_land],
+            False)
+        active = (state >= STATE_READY) & (state <= STATE_MAIN) & (state != STATE_PROG)
+        counter = np.where(active & hold, reload[rows, state], counter)
+        advance = active & ~hold & (counter == 0)
+        if advance.any():
+            is_main = state == STATE_MAIN
+            counter = np.where(advance & ~is_main, load[rows, state], counter)
+            state = np.where(advance, next_state[state], state)
+            # Only the first entry counts, and not past the end of a flight
+            live = advance & (n < lengths)
+            for code, name in replay_states.items():
+                first = live & (state == code) & np.isnan(out[name])
+                out[name][first] = n / tick_rate
+        if trace:
+            states[:, :, n] = state
+        if np.all(state == STATE_LANDED):
+            if trace:
+                states[:, :, n + 1:] = STATE_LANDED
+            break
+    return (out, states) if trace else out
+
+# Logged times (s) count ticks in a uint16, so they wrap at this
+wrap_time = 0x10000 / log_rate
+# Longest time (s) between logged frames; the logging divider is a uint8_t
+max_gap = 0x100 / log_rate
+
+# Number of samples at the start of a logged track that belong to the last
+# flight. As in nanodeploy.frames_in_log, a dump of the whole EEPROM ends at
+# the first time earlier than the one before it (left over from an older
+# flight), except in the launch buffer, or where the tick counter wrapped.
+def log_length(time) -> int:
+    steps = np.diff(np.asarray(time, dtype=float))
+    back = (steps < 0) & (steps >= -wrap_time / 2)
+    back[:launch_pages * 64 // mem_per_packet] = False
+    ends = np.flatnonzero(back)
+    return int(ends[0]) + 1 if len(ends) else len(steps) + 1
+
+# Resamples a logged track to one altitude per tick. Logged times repeat, step
+# back after the launch buffer and wrap, so np.interp can't take them as they
+# are: wraps are undone, and the track is split wherever time doesn't move
+# forward or jumps by more than max_gap. Only the longest piece is resampled,
+# over the span of its times.
+def resample(time, altitude, rate: float = tick_rate) -> np.ndarray:
+    time = np.asarray(time, dtype=float)
+    altitude = np.asarray(altitude, dtype=float)
+    steps = np.diff(time)
+    time = time + wrap_time * np.concatenate(([0], np.cumsum(steps < -wrap_time / 2)))
+    steps = np.diff(time)
+    breaks = np.flatnonzero((steps <= 0) | (steps > max_gap)) + 1
+    bounds = np.concatenate(([0], breaks, [len(time)]))
+    longest = np.argmax(np.diff(bounds))
+    start, end = bounds[longest], bounds[longest + 1]
+    if end - start < 2 or time[end - 1] - time[start] < 1 / rate:
+        raise ValueError("Track has no stretch of increasing times to resample")
+    ticks = np.arange(time[start], time[end - 1], 1 / rate)
+    return np.interp(ticks, time[start:end], altitude[start:end])
+
+# Per-tick altitudes of the last flight in logged frames (see
+# nanodeploy_image.load_flight), at rate samples per second
+def logged_track(frames: np.ndarray, rate: float = tick_rate) -> np.ndarray:
+    field = "baro_altitude" if "baro_altitude" in frames.dtype.names else "altitude"
+    length = log_length(frames["time"])
+    # Older versions of nanodeploy wrote the int16 altitude unsigned
+    alt = (frames[field][:length].astype(np.int64) + 0x8000) % 0x10000 - 0x8000
+    return resample(frames["time"][:length], alt, rate)
+
+# Per-tick input from a flight file (see nanodeploy_image.load_flight): the
+# logged altitude above ground_alt, after pad seconds on the ground for
+# calibration and to settle
+def flight_from_log(path: str, ground_alt: int = 0, pad: float = 5.0) -> np.ndarray:
+    alt = logged_track(nanodeploy_image.load_flight(path))
+    alt = np.concatenate((np.full(int(pad * tick_rate), alt[0]), alt))
+    return np.clip(np.rint(alt + ground_alt), 0, 0xFFFF).astype(np.uint16)
+
+# A made-up flight: pad seconds on the ground, a constant-thrust boost, a
+# ballistic coast, then descent at drogue_rate down to main_alt and main_rate
+# below it, and a rest on the ground. Rates are in m/s, altitudes in m.
+def synthetic_flight(accel: float = 100, burn: float = 1.5, drogue_rate: float = 25,
+                     main_rate: float = 6, main_alt: float = 150, noise: float = 1.0,
+                     ground_alt: int = 0, pad: float = 5.0, rest: float = 10.0,
+                     seed: int | None = None) -> np.ndarray:
+    g = 9.81
+    dt = 1 / tick_rate
+    burnout_v = (accel - g) * burn
+    burnout_h = (accel - g) * burn**2 / 2
+    apogee = burnout_h + burnout_v**2 / (2 * g)
+    t_apogee = burn + burnout_v / g
+    t_main = t_apogee + max(apogee - main_alt, 0) / drogue_rate
+    t_land = t_main + min(main_alt, apogee) / main_rate
+    t = np.arange(-pad, t_land + rest, dt)
+    alt = np.select(
+        [t < 0, t < burn, t < t_apogee, t < t_main, t < t_land],
+        [0,
+         (accel - g) * t**2 / 2,
+         burnout_h + burnout_v * (t - burn) - g * (t - burn)**2 / 2,
+         apogee - drogue_rate * (t - t_apogee),
+         min(main_alt, apogee) - main_rate * (t - t_main)],
+        0)
+    alt = alt + np.random.default_rng(seed).normal(0, noise, len(t))
+    return np.clip(np.rint(alt + ground_alt), 0, 0xFFFF).astype(np.uint16)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replays flights through the firmware's calibration, Kalman filter and state machine."
+    )
+    parser.add_argument("logs", nargs='*', help="Flight files to replay (see nanodeploy_image.load_flight)")
+    parser.add_argument("-s", "--synthetic", type=int, default=0, help="Also replay this many made-up flights")
+    parser.add_argument("-g", "--ground", type=int, default=0, help="Ground altitude (m) to add to logged flights")
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="FIELD=V1,V2,...",
+                        help="Values to try for a parameter (see params_dtype); every combination is replayed")
+    args = parser.parse_args()
+
+    flights = []
+    for path in args.logs:
+        try:
+            flights.append(flight_from_log(path, args.ground))
+        except ValueError as e:
+            print(f"{path}: {e}")
+            exit(-1)
+    rng = np.random.default_rng(0)
+    for i in range(args.synthetic):
+        flights.append(synthetic_flight(accel=rng.uniform(50, 120), burn=rng.uniform(0.8, 2),
+                                        drogue_rate=rng.uniform(15, 35), main_rate=rng.uniform(4, 8),
+                                        noise=rng.uniform(0.5, 3), ground_alt=args.ground, seed=i))
+    if not flights:
+        print("No flights to replay")
+        exit(-1)
+
+    base = make_params([Config.make_default(DeviceID(), "replay")])[0]
+    grid = []
+    for spec in args.param:
+        field, _, values = spec.partition("=")
+        if field not in params_dtype.names:
+            print(f"Unknown parameter {field}")
+            exit(-1)
+        grid.append([(field, int(v)) for v in values.split(",")])
+    combos = list(itertools.product(*grid))
+    params = np.repeat(base[None], len(combos), axis=0)
+    for i, combo in enumerate(combos):
+        for field, value in combo:
+            params[i][field] = value
+
+    results = replay(flights, params)
+    for i, combo in enumerate(combos):
+        label = ", ".join(f"{field}={value}" for field, value in combo) or "defaults"
+        print(f"{label}:")
+        for name in replay_states.values():
+            t = results[name][i]
+            reached = ~np.isnan(t)
+            if reached.any():
+                print(f"  {name}\t{reached.sum()}/{len(flights)} flights, "
+                      f"{np.min(t[reached]):.2f} / {np.median(t[reached]):.2f} / {np.max(t[reached]):.2f} s")
+            else:
+                print(f"  {name}\tnever")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+
+import json
+import time
+import argparse
+import typing
+import numpy as np
+
+import kalman_filter
+import kalman_iir
+import kalman_fixed
+import make_kalman
+
+# Benchmarks the Kalman filter implementations without plotting anything:
+# every stage of the kalman_filter.py derivation plus the production paths,
+# each timed and scored against its reference (see kalman_filter.references)
+# on any number of flight logs.
+#
+# A benchmark is a function (fd, ts, sigsq_a, sigsq_z) -> altitude estimates,
+# registered in benchmarks by name as (description, function, reference).
+benchmarks: dict[str, tuple[str, typing.Callable, str]] = dict(kalman_filter.variants)
+
+def register(name: str, description: str, func: typing.Callable, reference: str = "matrix"):
+    if reference not in kalman_filter.references:
+        raise ValueError(f"Unknown reference {reference}, expected one of {', '.join(kalman_filter.references)}")
+    benchmarks[name] = (description, func, reference)
+
+def _iir(fd, ts, sigsq_a, sigsq_z):
+    return kalman_iir.steady_state_filter(fd, ts, sigsq_z, sigsq_a)[:, 0]
+
+# The generated firmware filter, with constants for these parameters
+def _firmware(fd, ts, sigsq_a, sigsq_z):
+    divisors = make_kalman.kalman_divisors(ts, sigsq_z, sigsq_a)
+    return kalman_fixed.run_kalman(np.asarray(fd).astype(np.int16), divisors)[:, 0]
+
+register("iir", "steady-state IIR pass", _iir, "steady")
+register("firmware", "generated update_kalman", _firmware, "steady")
+
+# Times every named benchmark (all by default) on one flight, taking the
+# fastest of repeat runs. Returns one row per benchmark, with times in seconds
+# and errors in metres; a fixed-point stage that overflows on the flight gets
+# NaN times and errors, and the overflow in "error".
+def run(fd: np.ndarray, ts: float, names: list[str] | None = None, repeat: int = 1,
+        sigsq_a: float = kalman_filter.sigsq_a,
+        sigsq_z: float = kalman_filter.sigsq_z) -> list[dict[str, typing.Any]]:
+    refs = {name: func(fd, ts, sigsq_a, sigsq_z) for name, func in kalman_filter.references.items()}
+    rows = []
+    for name in names or list(benchmarks):
+        description, func, reference = benchmarks[name]
+        best = float("inf")
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                alt = func(fd, ts, sigsq_a, sigsq_z)
+                best = min(best, time.perf_counter() - start)
+        except OverflowError as e:
+            rows.append({"name": name, "description": description, "reference": reference,
+                         "seconds": float("nan"), "per_sample": float("nan"),
+                         "rms": float("nan"), "max": float("nan"), "error": str(e)})
+            continue
+        rmse, maxe = kalman_filter.errors(alt, refs[reference])
+        rows.append({"name": name, "description": description, "reference": reference,
+                     "seconds": best, "per_sample": best / max(len(fd), 1),
+                     "rms": rmse, "max": maxe, "error": None})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Times the Kalman filter variants and scores them against their references."
+    )
+    parser.add_argument("logs", nargs='*', help="Flight log CSVs (made-up data if none)")
+    parser.add_argument("-k", "--only", action="append", default=None, choices=list(benchmarks),
+                        help="Run only this benchmark (repeatable)")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="Runs per benchmark, keeping the fastest")
+    parser.add_argument("-j", "--json", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for path in args.logs or [None]:
+        td_with_start, fd_with_start = kalman_filter.load_data(path)
+        ts = kalman_filter.timestep(td_with_start)
+        rows = run(fd_with_start[1:], ts, args.only, args.repeat)
+        label = path or "(made-up data)"
+        results[label] = rows
+        print(f"{label}: {len(fd_with_start) - 1} samples, ts {ts:.4g} s")
+        print("name\tref\ttime (ms)\tus/sample\tRMS (m)\tmax (m)")
+        for row in rows:
+            if row["error"] is not None:
+                print(f"{row['name']}\t{row['reference']}\t{row['error']}")
+                continue
+            print(f"{row['name']}\t{row['reference']}\t{row['seconds']*1000:.2f}"
+                  f"\t{row['per_sample']*1e6:.2f}\t{row['rms']:.4g}\t{row['max']:.4g}")
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
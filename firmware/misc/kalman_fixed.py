@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+import os
+import re
+import sys
+import argparse
+import numpy as np
+
+import make_kalman
+from make_divider import apply_divider
+from kalman_steady_state import steady_state
+
+# Bit-exact model of the fixed-point update_kalman that make_kalman.py
+# generates, built from the same divisors, so the firmware's filter can be run
+# over logged flights without hardware. Every function takes NumPy arrays with
+# any number of leading axes (e.g. one per flight) and filters them all at once.
+#
+# The state is int16 altitude (m), velocity (m/s * 16) and acceleration
+# (m/s^2 * 16); arithmetic wraps at 16 bits, as int does on the MSP430.
+state_scale = np.asarray([1, 16, 16])
+
+# One step of update_kalman: the new state from states x (..., 3) and
+# measurements zk (...)
+def update_kalman(x, zk, divisors: dict[str, float] | None = None):
+    if divisors is None:
+        divisors = make_kalman.divisors
+
+    def div(name: str, n):
+        return apply_divider(n, divisors[name], make_kalman.kalman_bits, signed=True)
+
+    x = np.asarray(x).astype(np.int16)
+    zk = np.asarray(zk).astype(np.int16)
+    err = x[..., 0] - zk
+    x_new = np.empty(np.broadcast_shapes(x.shape, zk.shape + (3,)), dtype=np.int16)
+    x_new[..., 0] = zk + div("div_x0_x1", x[..., 1]) + div("div_x0_x0zk", err)
+    x_new[..., 1] = div("div_x1_x2", x[..., 2]) + div("div_x1_x1", x[..., 1]) - div("div_x1_x0zk", err)
+    x_new[..., 2] = x[..., 2] - div("div_x2_x1", x[..., 1]) - div("div_x2_x0zk", err)
+    return x_new
+
+# Filters measurements zk (..., samples) from state x0 (zero by default, as
+# after calibration), returning the state after every sample (..., samples, 3)
+def run_kalman(zk, divisors: dict[str, float] | None = None, x0=None):
+    zk = np.asarray(zk).astype(np.int16)
+    x = np.zeros(zk.shape[:-1] + (3,), dtype=np.int16) if x0 is None else np.asarray(x0)
+    out = np.empty(zk.shape + (3,), dtype=np.int16)
+    for n in range(zk.shape[-1]):
+        x = update_kalman(x, zk[..., n], divisors)
+        out[..., n, :] = x
+    return out
+
+# The floating-point steady-state filter the fixed-point one approximates, in
+# the same units
+def run_float(zk, ts: float = make_kalman.ts, sigsq_z: float = make_kalman.sigsq_z,
+              sigsq_a: float = make_kalman.sigsq_a):
+    F = np.asarray([[1,    ts,   1/2*ts**2],
+                    [0,    1,    ts],
+                    [0,    0,    1]])
+    G = np.asarray([[1/6*ts**3],
+                    [1/2*ts**2],
+                    [ts]])
+    _, K = steady_state(F, np.asarray([[1, 0, 0]]), np.asarray([[sigsq_z]]), G * G.T * sigsq_a)
+    K = K[:, 0]
+    zk = np.asarray(zk, dtype=float)
+    x = np.zeros(zk.shape[:-1] + (3,))
+    out = np.empty(zk.shape + (3,))
+    for n in range(zk.shape[-1]):
+        x = x @ F.T
+        x += K * (zk[..., n] - x[..., 0])[..., None]
+        out[..., n, :] = x
+    return out * state_scale
+
+# Whether a generated header is what make_kalman.py would generate now, so
+# the firmware and this model agree
+def header_matches(path: str, divisors: dict[str, float] | None = None) -> bool:
+    with open(path, "r") as f:
+        text = f.read()
+    guard = re.search(r"#ifndef (\w+)", text)
+    if guard is None:
+        return False
+    return text == make_kalman.kalman_header(guard.group(1), divisors or make_kalman.divisors)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the firmware's fixed-point Kalman filter over flight logs, "
+        "comparing it to the floating-point filter."
+    )
+    parser.add_argument("logs", nargs='*', help="Flight log CSVs; their altitudes are the measurements")
+    parser.add_argument("--header", default=None, help="Generated kalman_step.h to check against make_kalman.py")
+    args = parser.parse_args()
+
+    if args.header is not None:
+        if not header_matches(args.header):
+            print(f"{args.header} differs from what make_kalman.py generates; regenerate it")
+            exit(-1)
+        print(f"{args.header} matches make_kalman.py")
+    if not args.logs:
+        return
+
+    # The host tools at the top of the repository read the logs
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    import nanodeploy
+
+    # Measurements are relative to the first, as to the calibrated ground
+    # altitude on the device; shorter flights are padded and trimmed after
+    flights = [nanodeploy.load_csv(path, ["baro_altitude"])["baro_altitude"] for path in args.logs]
+    zk = np.zeros((len(flights), max(len(f) for f in flights)), dtype=np.int16)
+    for i, f in enumerate(flights):
+        zk[i, :len(f)] = np.asarray(f - f[0]).astype(np.int16)
+    fixed = run_kalman(zk)[..., 0]
+    exact = run_float(zk)[..., 0]
+    print("log\tRMS (m)\tmax (m)")
+    for i, path in enumerate(args.logs):
+        err = fixed[i, :len(flights[i])] - exact[i, :len(flights[i])]
+        print(f"{path}\t{np.sqrt(np.mean(err**2)):.3f}\t{np.max(np.abs(err)):.3f}")
+
+if __name__ == "__main__":
+    main()
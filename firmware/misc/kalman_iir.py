@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+import make_kalman
+from kalman_steady_state import steady_state
+
+# With a constant timestep the steady-state filter is linear and
+# time-invariant: each step is x_n = A x_(n-1) + K z_n, with A = (I - K H) F.
+# So each state is the measurements run through a fixed 3rd-order IIR filter,
+# and whole flights can be filtered in one recursive-filter call instead of a
+# Python loop per sample. Starts from a zero state, as kalman_filter.py does.
+#
+# SciPy is optional: with it, every flight goes through scipy.signal.sosfilt
+# at once; without it, the recursion is run in blocks (see block_filter).
+
+def model(ts: float, sigsq_z: float, sigsq_a: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    F = np.asarray([[1,    ts,   1/2*ts**2],
+                    [0,    1,    ts],
+                    [0,    0,    1]])
+    H = np.asarray([[1, 0, 0]])
+    R = np.asarray([[sigsq_z]])
+    G = np.asarray([[1/6*ts**3],
+                    [1/2*ts**2],
+                    [ts]])
+    return F, H, R, G * G.T * sigsq_a
+
+# Steady-state update matrix A and gain K for the given parameters
+def steady_state_system(ts: float, sigsq_z: float, sigsq_a: float) -> tuple[np.ndarray, np.ndarray]:
+    F, H, R, Q = model(ts, sigsq_z, sigsq_a)
+    _, K = steady_state(F, H, R, Q)
+    return (np.eye(3) - K @ H) @ F, K[:, 0]
+
+# Transfer function of each state, as numerator rows b (3, 4) and a shared
+# denominator a (4,), in powers of z^-1. The denominator is the characteristic
+# polynomial of A; writing x_n = A s_n + K z_n with s_n = x_(n-1), each
+# numerator is det(I - (A - K A_i) z^-1) + (K_i - 1) a.
+def transfer_function(A: np.ndarray, K: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    a = np.poly(A)
+    b = np.stack([np.poly(A - np.outer(K, A[i])) + (K[i] - 1) * a for i in range(len(K))])
+    return b, a
+
+# Runs x_n = A x_(n-1) + K z_n over measurements zk (..., samples) from a zero
+# state, returning every state (..., samples, 3), without SciPy. The samples
+# are cut into blocks of block samples. Within a block, the response to its
+# own measurements is one matrix product with the impulse response A^m K for
+# every block at once. Each block then only needs the state the previous one
+# ended in, carried forward through A^(j+1), which is one step per block
+# rather than per sample.
+def block_filter(zk: np.ndarray, A: np.ndarray, K: np.ndarray, block: int = 128) -> np.ndarray:
+    samples = zk.shape[-1]
+    blocks = -(-samples // block)
+    zk = np.concatenate((zk, np.zeros(zk.shape[:-1] + (blocks * block - samples,))), axis=-1)
+    powers = np.empty((block, 3, 3))
+    power = np.eye(3)
+    for j in range(block):
+        power = A @ power
+        powers[j] = power
+    response = np.concatenate((K[None], powers[:-1] @ K))
+    # step[i, j, s] is state s at sample j of a block, per unit measurement
+    # at sample i
+    lag = np.arange(block)[None, :] - np.arange(block)[:, None]
+    step = np.where((lag >= 0)[..., None], response[np.maximum(lag, 0)], 0)
+    out = zk.reshape(zk.shape[:-1] + (blocks, block)) @ step.reshape(block, block * 3)
+    out = out.reshape(zk.shape[:-1] + (blocks, block, 3))
+    x = np.zeros(zk.shape[:-1] + (3,))
+    for b in range(blocks):
+        out[..., b, :, :] += np.einsum("jsk,...k->...js", powers, x)
+        x = out[..., b, -1, :]
+    return out.reshape(zk.shape[:-1] + (blocks * block, 3))[..., :samples, :]
+
+# Filters measurements zk (..., samples) with the steady-state filter,
+# returning every state after every sample (..., samples, 3)
+def steady_state_filter(zk, ts: float, sigsq_z: float, sigsq_a: float):
+    A, K = steady_state_system(ts, sigsq_z, sigsq_a)
+    zk = np.asarray(zk, dtype=float)
+    try:
+        from scipy import signal
+    except ImportError:
+        return block_filter(zk, A, K)
+    # Second-order sections: the poles are all close to 1, where a single
+    # 3rd-order section loses precision
+    b, a = transfer_function(A, K)
+    return np.stack([signal.sosfilt(signal.tf2sos(b[i], a), zk, axis=-1)
+                     for i in range(3)], axis=-1)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Filters flight logs with the steady-state Kalman filter as one IIR pass."
+    )
+    parser.add_argument("logs", nargs='+', help="Flight log CSVs")
+    parser.add_argument("-a", "--sigma-a", type=float, default=20, help="Acceleration noise std. dev. (m/s^3)")
+    parser.add_argument("-z", "--sigma-z", type=float, default=5, help="Measurement noise std. dev. (m)")
+    args = parser.parse_args()
+
+    # The host tools at the top of the repository read the logs
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    import nanodeploy
+    from flight_replay import logged_track
+
+    for path in args.logs:
+        # The filter's matrices are only right at the firmware's timestep, so
+        # logs decimated to any rate are resampled to it first
+        try:
+            zk = logged_track(nanodeploy.load_csv(path, ["time", "baro_altitude"]), 1 / make_kalman.ts)
+        except ValueError as e:
+            print(f"{path}: {e}")
+            exit(-1)
+        start = time.perf_counter()
+        x = steady_state_filter(zk, make_kalman.ts, args.sigma_z**2, args.sigma_a**2)
+        took = time.perf_counter() - start
+        print(f"{path}: {len(zk)} samples in {took*1000:.2f} ms; apogee {np.max(x[:, 0]):.1f} m, "
+              f"max velocity {np.max(x[:, 1]):.1f} m/s")
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,71 @@ import numpy as np
 # Compute a steady state covariance (P) matrix for the given parameters.
 # Computes iteratively; stops computation when the error in every cell is less
 # than thresh * the cell value. E.g., a threshold of 1/1000 will make sure all
-# values are stable within 0.1% per iteration.
-def steady_state_P(F: np.ndarray, H: np.ndarray, R: np.ndarray, Q: np.ndarray, thresh: float) -> np.ndarray:
+# values are stable within 0.1% per iteration. Raises if P stops being finite
+# or hasn't settled after max_iter steps.
+def steady_state_P(F: np.ndarray, H: np.ndarray, R: np.ndarray, Q: np.ndarray, thresh: float,
+                   max_iter: int = 100000) -> np.ndarray:
     def P_step(P_nn: np.ndarray) -> np.ndarray:
         P_npred = F @ P_nn @ F.T + Q
         S_n = H @ P_npred @ H.T + R
         K_n = P_npred @ H.T @ np.linalg.inv(S_n)
         return (np.eye(3) - K_n @ H) @ P_npred
     P_nn = np.zeros_like(F)
-    while True:
+    for _ in range(max_iter):
         P_new = P_step(P_nn)
+        if not np.all(np.isfinite(P_new)):
+            raise ArithmeticError("Covariance isn't finite; check the parameters")
         if not np.any(P_nn == 0):
             maxe = np.max((P_new - P_nn) / P_nn)
             if maxe < thresh:
                 return P_nn
-        P_nn = P_new
\ No newline at end of file
+        P_nn = P_new
+    raise ArithmeticError(f"Covariance didn't settle in {max_iter} steps")
+
+# Results of steady_state, keyed on the exact parameter arrays
+_solutions: dict[bytes, tuple[np.ndarray, np.ndarray]] = {}
+
+# Compute the steady state covariance (P) and Kalman gain (K) directly, by
+# solving the discrete algebraic Riccati equation for the predicted covariance
+# with the structure-preserving doubling algorithm. It converges quadratically,
+# so takes a few dozen steps at most where steady_state_P can take thousands.
+# P is the updated (a posteriori) covariance, as steady_state_P returns.
+# Results are memoized and returned read-only, so share them rather than
+# modifying them.
+def steady_state(F: np.ndarray, H: np.ndarray, R: np.ndarray, Q: np.ndarray,
+                 tol: float = 1e-12, max_iter: int = 64) -> tuple[np.ndarray, np.ndarray]:
+    F, H, R, Q = (np.atleast_2d(np.asarray(m, dtype=float)) for m in (F, H, R, Q))
+    if not all(np.all(np.isfinite(m)) for m in (F, H, R, Q)):
+        raise ArithmeticError("Model isn't finite; check the parameters")
+    key = b"".join(repr(m.shape).encode() + m.tobytes() for m in (F, H, R, Q, np.asarray([tol])))
+    if key in _solutions:
+        return _solutions[key]
+
+    # The filtering Riccati equation is the dual of the control one, so F and
+    # H go in transposed
+    n = F.shape[0]
+    A = F.T
+    G = H.T @ np.linalg.solve(R, H)
+    X = Q
+    for _ in range(max_iter):
+        W = np.eye(n) + G @ X
+        WA = np.linalg.solve(W, A)
+        X_new = X + A.T @ X @ WA
+        G = G + A @ np.linalg.solve(W, G) @ A.T
+        A = A @ WA
+        converged = np.max(np.abs(X_new - X)) <= tol * np.max(np.abs(X_new))
+        X = X_new
+        if converged:
+            break
+    else:
+        raise ArithmeticError(f"Riccati equation didn't converge in {max_iter} steps")
+    X = (X + X.T) / 2
+
+    S = H @ X @ H.T + R
+    K = np.linalg.solve(S, H @ X).T
+    P = (np.eye(n) - K @ H) @ X
+    P = (P + P.T) / 2
+    P.setflags(write=False)
+    K.setflags(write=False)
+    _solutions[key] = (P, K)
+    return P, K
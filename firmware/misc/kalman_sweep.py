@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import argparse
+import numpy as np
+
+# Runs the full-matrix reference filter from kalman_filter.py over a grid of
+# noise parameters and many flights at once, to tune sigsq_a and sigsq_z
+# against a reference track.
+#
+# The covariance P (and so the gain K) doesn't depend on the measurements, so
+# it is stepped once per parameter pair, batched over the grid; the state is
+# then stepped for every (parameter pair, flight) at once. With H = [1, 0, 0]
+# the innovation covariance is a scalar, so there's no matrix inverse.
+
+def geomean(a: np.ndarray) -> float:
+    return np.exp(np.sum(np.log(a)) / a.size)
+
+# State transition and process noise for a timestep, batched over sigsq_a
+def model(ts: float, sigsq_a: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    F = np.asarray([[1,    ts,   1/2*ts**2],
+                    [0,    1,    ts],
+                    [0,    0,    1]])
+    G = np.asarray([[1/6*ts**3],
+                    [1/2*ts**2],
+                    [ts]])
+    Q = (G * G.T)[None] * np.asarray(sigsq_a, dtype=float).reshape(-1, 1, 1)
+    return F, Q
+
+# Kalman gains for the first steps samples, starting from P = 0 as
+# kalman_filter.py does. sigsq_a and sigsq_z are broadcast together to a batch
+# of pairs; returns shape (steps, pairs, 3).
+def gains(ts: float, sigsq_a, sigsq_z, steps: int) -> np.ndarray:
+    sigsq_a, sigsq_z = np.broadcast_arrays(np.asarray(sigsq_a, dtype=float),
+                                           np.asarray(sigsq_z, dtype=float))
+    sigsq_a = sigsq_a.ravel()
+    sigsq_z = sigsq_z.ravel()
+    F, Q = model(ts, sigsq_a)
+    P = np.zeros((len(sigsq_a), 3, 3))
+    K = np.empty((steps, len(sigsq_a), 3))
+    for n in range(steps):
+        P = F @ P @ F.T + Q
+        K[n] = P[:, :, 0] / (P[:, 0, 0] + sigsq_z)[:, None]
+        P = P - K[n][:, :, None] * P[:, 0, None, :]
+    return K
+
+# Pads flights of different lengths into one (flights, samples) array with NaN
+def pad(flights: list[np.ndarray]) -> np.ndarray:
+    out = np.full((len(flights), max((len(f) for f in flights), default=0)), np.nan)
+    for i, f in enumerate(flights):
+        out[i, :len(f)] = f
+    return out
+
+# Filters every flight with every parameter pair in the grid sigsq_a x sigsq_z
+# and compares the altitude estimates to references (defaulting to the
+# measurements). ts defaults to the geometric mean timestep of the flights'
+# times, as in kalman_filter.py, so one of the two must be given. As there,
+# zero and negative steps (repeated timestamps, or the tick counter wrapping)
+# are left out of the mean, and times with no positive step are rejected. Returns the RMS and maximum absolute error,
+# each shaped (len(sigsq_a), len(sigsq_z)), pooled over all flights, or
+# shaped (len(sigsq_a), len(sigsq_z), flights) if per_flight is set.
+def sweep(flights: list[np.ndarray], sigsq_a, sigsq_z, ts: float | None = None,
+          times: list[np.ndarray] | None = None, references: list[np.ndarray] | None = None,
+          per_flight: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    if ts is None:
+        if times is None:
+            raise ValueError("Either ts or times is needed to find the timestep")
+        steps = np.concatenate([np.diff(t) for t in times] + [np.empty(0)])
+        steps = steps[steps > 0]
+        if steps.size == 0:
+            raise ValueError("No increasing timestamps in times to find the timestep from")
+        ts = geomean(steps)
+    sigsq_a = np.atleast_1d(np.asarray(sigsq_a, dtype=float))
+    sigsq_z = np.atleast_1d(np.asarray(sigsq_z, dtype=float))
+    grid_a, grid_z = np.meshgrid(sigsq_a, sigsq_z, indexing="ij")
+    z = pad(flights)
+    ref = z if references is None else pad(references)
+    K = gains(ts, grid_a, grid_z, z.shape[1])
+    F, _ = model(ts, sigsq_a[:1])
+
+    pairs = grid_a.size
+    x = np.zeros((pairs, len(flights), 3))
+    sum_sq = np.zeros((pairs, len(flights)))
+    max_err = np.zeros((pairs, len(flights)))
+    for n in range(z.shape[1]):
+        x = x @ F.T
+        x += K[n][:, None, :] * (z[None, :, n] - x[:, :, 0])[:, :, None]
+        err = np.abs(x[:, :, 0] - ref[None, :, n])
+        # Flights that already ended are padded with NaN and drop out here
+        valid = ~np.isnan(err)
+        sum_sq += np.where(valid, err * err, 0)
+        np.fmax(max_err, err, out=max_err)
+    count = np.sum(~np.isnan(ref), axis=1)
+    shape = (len(sigsq_a), len(sigsq_z))
+    if per_flight:
+        rms = np.sqrt(sum_sq / np.maximum(count, 1))
+        return rms.reshape(shape + (len(flights),)), max_err.reshape(shape + (len(flights),))
+    rms = np.sqrt(np.sum(sum_sq, axis=1) / max(np.sum(count), 1))
+    return rms.reshape(shape), np.max(max_err, axis=1).reshape(shape)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweeps Kalman filter noise parameters over a set of flight logs."
+    )
+    parser.add_argument("logs", nargs='+', help="Flight log CSVs")
+    parser.add_argument("-a", "--sigma-a", type=float, nargs=3, default=[1, 100, 25],
+                        metavar=("MIN", "MAX", "N"), help="Log-spaced range of acceleration noise std. dev. (m/s^3)")
+    parser.add_argument("-z", "--sigma-z", type=float, nargs=3, default=[0.5, 50, 25],
+                        metavar=("MIN", "MAX", "N"), help="Log-spaced range of measurement noise std. dev. (m)")
+    parser.add_argument("-t", "--ts", type=float, default=None, help="Timestep (s); defaults to that of the logs")
+    args = parser.parse_args()
+
+    # The host tools at the top of the repository read the logs
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    import nanodeploy
+
+    logs = [nanodeploy.load_csv(path, ["baro_altitude", "time"]) for path in args.logs]
+    sigma_a = np.geomspace(args.sigma_a[0], args.sigma_a[1], int(args.sigma_a[2]))
+    sigma_z = np.geomspace(args.sigma_z[0], args.sigma_z[1], int(args.sigma_z[2]))
+    rms, maxe = sweep([log["baro_altitude"].astype(float) for log in logs],
+                      sigma_a**2, sigma_z**2, args.ts, [log["time"] for log in logs])
+    np.set_printoptions(linewidth=200, precision=3)
+    print("RMS error (m), rows sigma_a", sigma_a, "columns sigma_z", sigma_z)
+    print(rms)
+    best = np.unravel_index(np.argmin(rms), rms.shape)
+    print(f"Lowest RMS error {rms[best]:.3f} m (max {maxe[best]:.3f} m) at "
+          f"sigma_a {sigma_a[best[0]]:.3g}, sigma_z {sigma_z[best[1]]:.3g}")
+
+if __name__ == "__main__":
+    main()
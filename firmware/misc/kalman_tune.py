@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import argparse
+import concurrent.futures
+import numpy as np
+
+import make_kalman
+from kalman_iir import steady_state_filter
+
+# Tunes the Kalman filter noise parameters (sigsq_a, sigsq_z) on a corpus of
+# recorded flights. Candidates are scored in parallel across processes on two
+# things that trade off against each other:
+#   lag    mean time (s) from the highest measured altitude until the filtered
+#          velocity first goes negative, which is when the firmware starts
+#          timing apogee
+#   noise  RMS sample-to-sample change of the filtered velocity's slope (m/s),
+#          jitter that the flight itself hardly contributes to
+# and the Pareto front of the two is reported. Flights are cut to the last
+# flight and resampled to the firmware's tick rate first (see
+# flight_replay.logged_track), since the filter runs at its timestep whatever
+# rate the log was decimated to. Scores are checkpointed as they come in, so an
+# interrupted sweep resumes where it stopped. The chosen parameters are written
+# as JSON for make_kalman.py to generate a header from.
+
+# Filled in once in every worker process by _init_worker
+_flights: list[np.ndarray] = []
+_ts = make_kalman.ts
+
+def _init_worker(flights: list[np.ndarray], ts: float):
+    global _flights, _ts
+    _flights = flights
+    _ts = ts
+
+# Scores one candidate over the whole corpus as (lag, noise)
+def score(sigsq_a: float, sigsq_z: float, flights: list[np.ndarray] | None = None,
+          ts: float | None = None) -> tuple[float, float]:
+    flights = _flights if flights is None else flights
+    ts = _ts if ts is None else ts
+    lags = []
+    jitter = []
+    for alt in flights:
+        x = steady_state_filter(alt - alt[0], ts, sigsq_z, sigsq_a)
+        velocity = x[:, 1]
+        jitter.append(np.diff(velocity, 2))
+        # Searching from the fastest point skips noise on the pad
+        fastest = np.argmax(velocity)
+        falling = np.flatnonzero(velocity[fastest:] < 0)
+        if len(falling) > 0:
+            lags.append((fastest + falling[0] - np.argmax(alt)) * ts)
+    noise = np.concatenate(jitter)
+    return (float(np.mean(np.abs(lags))) if lags else float("inf"),
+            float(np.sqrt(np.mean(noise**2))) if len(noise) else 0.0)
+
+def _score_pair(pair: tuple[float, float]) -> tuple[tuple[float, float], tuple[float, float]]:
+    return pair, score(*pair)
+
+# Scores as {(sigsq_a, sigsq_z): (lag, noise)} from a checkpoint, if any
+def load_checkpoint(path: str) -> dict[tuple[float, float], tuple[float, float]]:
+    try:
+        with open(path, "r") as f:
+            rows = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {(row["sigsq_a"], row["sigsq_z"]): (row["lag"], row["noise"]) for row in rows}
+
+def save_checkpoint(path: str, scores: dict[tuple[float, float], tuple[float, float]]):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump([{"sigsq_a": a, "sigsq_z": z, "lag": lag, "noise": noise}
+                   for (a, z), (lag, noise) in scores.items()], f)
+    os.replace(tmp, path)
+
+# Scores every candidate not already in the checkpoint across a process pool,
+# saving the checkpoint every save_every results and at the end
+def tune(flights: list[np.ndarray], candidates: list[tuple[float, float]], ts: float,
+         checkpoint: str | None = None, workers: int | None = None,
+         save_every: int = 16) -> dict[tuple[float, float], tuple[float, float]]:
+    scores = load_checkpoint(checkpoint) if checkpoint is not None else {}
+    todo = [pair for pair in candidates if pair not in scores]
+    if len(todo) < len(candidates):
+        print(f"Resuming with {len(candidates) - len(todo)} of {len(candidates)} candidates scored")
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                initargs=(flights, ts)) as pool:
+        try:
+            for done, (pair, result) in enumerate(pool.map(_score_pair, todo, chunksize=4), 1):
+                scores[pair] = result
+                if checkpoint is not None and done % save_every == 0:
+                    save_checkpoint(checkpoint, scores)
+        finally:
+            if checkpoint is not None:
+                save_checkpoint(checkpoint, scores)
+    return {pair: scores[pair] for pair in candidates}
+
+# Candidates no other candidate beats on both lag and noise, by increasing lag
+def pareto_front(scores: dict[tuple[float, float], tuple[float, float]]) -> list[tuple[tuple[float, float], tuple[float, float]]]:
+    front = []
+    best_noise = float("inf")
+    for pair, (lag, noise) in sorted(scores.items(), key=lambda item: item[1]):
+        if noise < best_noise:
+            front.append((pair, (lag, noise)))
+            best_noise = noise
+    return front
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tunes the Kalman filter noise parameters on recorded flights."
+    )
+    parser.add_argument("logs", nargs='+', help="Flight log CSVs")
+    parser.add_argument("-a", "--sigma-a", type=float, nargs=3, default=[2, 200, 16],
+                        metavar=("MIN", "MAX", "N"), help="Log-spaced range of acceleration noise std. dev. (m/s^3)")
+    parser.add_argument("-z", "--sigma-z", type=float, nargs=3, default=[0.5, 50, 16],
+                        metavar=("MIN", "MAX", "N"), help="Log-spaced range of measurement noise std. dev. (m)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes")
+    parser.add_argument("-c", "--checkpoint", default=None, help="JSON file to save scores to and resume from")
+    parser.add_argument("-l", "--max-lag", type=float, default=0.25, help="Pick the least noisy candidate with at most this lag (s)")
+    parser.add_argument("-o", "--output", default=None, help="Write the picked parameters to this JSON file for make_kalman.py")
+    args = parser.parse_args()
+
+    # The host tools at the top of the repository read the logs
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    import nanodeploy
+    from flight_replay import logged_track
+
+    flights = []
+    for path in args.logs:
+        try:
+            flights.append(logged_track(nanodeploy.load_csv(path, ["time", "baro_altitude"]), 1 / make_kalman.ts))
+        except ValueError as e:
+            print(f"{path}: {e}")
+            exit(-1)
+    candidates = [(float(a**2), float(z**2))
+                  for a in np.geomspace(args.sigma_a[0], args.sigma_a[1], int(args.sigma_a[2]))
+                  for z in np.geomspace(args.sigma_z[0], args.sigma_z[1], int(args.sigma_z[2]))]
+    front = pareto_front(tune(flights, candidates, make_kalman.ts, args.checkpoint, args.jobs))
+
+    print("sigma_a\tsigma_z\tlag (s)\tnoise (m/s)")
+    for (sigsq_a, sigsq_z), (lag, noise) in front:
+        print(f"{sigsq_a**0.5:.3g}\t{sigsq_z**0.5:.3g}\t{lag:.3f}\t{noise:.4f}")
+    within = [entry for entry in front if entry[1][0] <= args.max_lag]
+    (sigsq_a, sigsq_z), (lag, noise) = within[-1] if within else front[0]
+    print(f"Picked sigma_a {sigsq_a**0.5:.3g}, sigma_z {sigsq_z**0.5:.3g} "
+          f"(lag {lag:.3f} s, noise {noise:.4f} m/s)")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"sigsq_a": sigsq_a, "sigsq_z": sigsq_z, "ts": make_kalman.ts}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
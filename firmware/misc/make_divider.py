@@ -5,7 +5,9 @@ import math
 import argparse
 
 
-def make_divider(divisor: float, bits: int, name: str, guard_define: str | None = None, gnu: bool = False, signed: bool = False) -> str | None:
+# Constants of a generated divider: the divisor scaled up to at least 1, the
+# magic multiplier m, the shift p and the shift back for the scaling
+def divider_constants(divisor: float, bits: int) -> tuple[float, int, int, int]:
     if divisor < 0:
         raise f"Divider {divisor} cannot be negative"
     postshift = 0
@@ -14,6 +16,25 @@ def make_divider(divisor: float, bits: int, name: str, guard_define: str | None
         postshift += 1
     p = math.ceil(math.log2(divisor))
     m = math.ceil((1 << (bits + p)) / divisor) & ((1 << bits) - 1)
+    return divisor, m, p, postshift
+
+# What the generated function computes for an integer NumPy array n, bit for
+# bit, assuming intermediate results wrap at the given width (as they do with
+# 16 bits on the MSP430, where int is 16 bits wide)
+def apply_divider(n, divisor: float, bits: int, signed: bool = False):
+    import numpy as np
+    divisor, m, p, postshift = divider_constants(divisor, bits)
+    itype = np.dtype(f"{'' if signed else 'u'}int{bits}")
+    ltype = np.dtype(f"{'' if signed else 'u'}int{bits*2}")
+    n = np.asarray(n).astype(itype)
+    if signed:
+        n = np.where(n < 0, n + itype.type(int(divisor) - 1), n).astype(itype)
+    q = ((ltype.type(m) * n.astype(ltype)) >> bits).astype(itype)
+    t = (((n - q) >> 1) + q) >> (p - 1)
+    return (t << postshift).astype(itype)
+
+def make_divider(divisor: float, bits: int, name: str, guard_define: str | None = None, gnu: bool = False, signed: bool = False) -> str | None:
+    divisor, m, p, postshift = divider_constants(divisor, bits)
 
     prefix = "" if signed else "u"
 
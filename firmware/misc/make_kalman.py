@@ -1,8 +1,9 @@
 #!/usr/bin/python3
 
 from make_divider import make_divider
-from kalman_steady_state import steady_state_P
+from kalman_steady_state import steady_state
 import numpy as np
+import json
 import sys
 import os
 
@@ -10,37 +11,46 @@ ts = 1/40
 sigsq_z = 5 ** 2
 sigsq_a = 20 ** 2
 
-F_full = np.asarray([[1,    ts,   1/2*ts**2],
-                     [0,    1,    ts],
-                     [0,    0,    1]])
-H = np.asarray([[1, 0, 0]])
-R = np.asarray([[sigsq_z]])
-G = np.asarray([[1/6*ts**3],
-                   [1/2*ts**2],
-                   [ts]])
-Q = G * G.T * sigsq_a
-
-P = steady_state_P(F_full, H, R, Q, 1/(1<<16))
-Pt = [P[0][0], P[0][1], P[0][2],
-               P[1][1], P[1][2],
-                        P[2][2]]
-
-invdenom = 1 / (2*Pt[1]*ts + Pt[0] + sigsq_z)
-
-div_x0_x1 = make_divider(1/(ts / 16 * invdenom * sigsq_z), 16, "div_x0_x1", signed=True)
-div_x0_x0zk = make_divider(1/(invdenom * sigsq_z), 16, "div_x0_x0zk", signed=True)
-div_x1_x2 = make_divider(1/ts, 16, "div_x1_x2", signed=True)
-div_x1_x1 = make_divider(1/(1 - Pt[1] * ts * invdenom), 16, "div_x1_x1", signed=True)
-div_x1_x0zk = make_divider(1/(((Pt[3] + Pt[2]) * ts + Pt[1]) * 16 * invdenom), 16, "div_x1_x0zk", signed=True)
-div_x2_x1 = make_divider(1/(Pt[2] * ts * invdenom), 16, "div_x2_x1", signed=True)
-div_x2_x0zk = make_divider(1/((Pt[4] * ts + Pt[2]) * 16 * invdenom), 16, "div_x2_x0zk", signed=True)
-
-outfile = sys.argv[1]
-
-guard_define = os.path.basename(outfile).upper()\
-    .translate({ord(c): "_" for c in "\"\'!@#$%^&*()[]{};:,./<>?\\|`~-=+"})
-
-outstr = f"""
+# Divisors of the dividers in the generated update_kalman, by function name,
+# for the steady state of the filter with the given parameters
+def kalman_divisors(ts: float, sigsq_z: float, sigsq_a: float) -> dict[str, float]:
+    F_full = np.asarray([[1,    ts,   1/2*ts**2],
+                         [0,    1,    ts],
+                         [0,    0,    1]])
+    H = np.asarray([[1, 0, 0]])
+    R = np.asarray([[sigsq_z]])
+    G = np.asarray([[1/6*ts**3],
+                    [1/2*ts**2],
+                    [ts]])
+    Q = G * G.T * sigsq_a
+
+    P, _ = steady_state(F_full, H, R, Q)
+    Pt = [P[0][0], P[0][1], P[0][2],
+                   P[1][1], P[1][2],
+                            P[2][2]]
+
+    invdenom = 1 / (2*Pt[1]*ts + Pt[0] + sigsq_z)
+
+    return {
+        "div_x0_x1": 1/(ts / 16 * invdenom * sigsq_z),
+        "div_x0_x0zk": 1/(invdenom * sigsq_z),
+        "div_x1_x2": 1/ts,
+        "div_x1_x1": 1/(1 - Pt[1] * ts * invdenom),
+        "div_x1_x0zk": 1/(((Pt[3] + Pt[2]) * ts + Pt[1]) * 16 * invdenom),
+        "div_x2_x1": 1/(Pt[2] * ts * invdenom),
+        "div_x2_x0zk": 1/((Pt[4] * ts + Pt[2]) * 16 * invdenom),
+    }
+
+# Every generated divider is 16-bit and signed
+kalman_bits = 16
+
+divisors = kalman_divisors(ts, sigsq_z, sigsq_a)
+
+# The generated header
+def kalman_header(guard_define: str, divisors: dict[str, float]) -> str:
+    dividers = "\n".join(make_divider(divisor, kalman_bits, name, signed=True)
+                         for name, divisor in divisors.items())
+    return f"""
 // Generated by {os.path.basename(__file__)}
 
 #ifndef {guard_define}
@@ -48,13 +58,7 @@ outstr = f"""
 
 #include <stdint.h>
 
-{div_x0_x1}
-{div_x0_x0zk}
-{div_x1_x2}
-{div_x1_x1}
-{div_x1_x0zk}
-{div_x2_x1}
-{div_x2_x0zk}
+{dividers}
 
 void update_kalman(int16_t* x_nn_new, const int16_t* x_nn, int16_t zk) {{
     x_nn_new[0] = zk
@@ -71,5 +75,20 @@ void update_kalman(int16_t* x_nn_new, const int16_t* x_nn, int16_t zk) {{
 #endif
 """
 
-with open(sys.argv[1], "w") as f:
-    f.write(outstr)
\ No newline at end of file
+# Usage: make_kalman.py <header> [parameters JSON from kalman_tune.py]
+if __name__ == "__main__":
+    outfile = sys.argv[1]
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "r") as f:
+            params = json.load(f)
+        # The header is only valid at the firmware's timestep
+        if params.get("ts", ts) != ts:
+            print(f"{sys.argv[2]} was tuned for a timestep of {params['ts']} s, not {ts} s")
+            exit(-1)
+        divisors = kalman_divisors(ts, params["sigsq_z"], params["sigsq_a"])
+
+    guard_define = os.path.basename(outfile).upper()\
+        .translate({ord(c): "_" for c in "\"\'!@#$%^&*()[]{};:,./<>?\\|`~-=+"})
+
+    with open(sys.argv[1], "w") as f:
+        f.write(kalman_header(guard_define, divisors))
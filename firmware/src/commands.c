@@ -12,7 +12,8 @@
 enum {
     XFER_RESELECT,
     XFER_MATCH,
-    XFER_EEPROM_DUMP
+    XFER_EEPROM_DUMP,
+    XFER_EEPROM_CRC
 } xfer_done_event;
 
 static uint8_t addr_buf[8];
@@ -23,6 +24,30 @@ static struct measurement_buffer {
     uint16_t temp;
 }* const meas_buf = (struct measurement_buffer*) databuf;
 
+static uint16_t* const crc_buf = (uint16_t*) databuf;
+
+// CRC-16 (poly 0xA001, reflected, as used by OneWire devices) of each of the
+// dbuf_sz/2 EEPROM pages starting at addr, so the host can tell which pages
+// changed without reading them. There isn't enough RAM for a spare page
+// buffer, so pages are read a few bytes at a time.
+static void eep_crc_pages(uint16_t addr) {
+    uint8_t chunk[8];
+    for(size_t page = 0; page < dbuf_sz / sizeof(uint16_t); page++) {
+        uint16_t crc = 0;
+        for(size_t offset = 0; offset < page_size; offset += sizeof(chunk)) {
+            eep_read(0b111, addr + offset, chunk, sizeof(chunk));
+            for(size_t i = 0; i < sizeof(chunk); i++) {
+                crc ^= chunk[i];
+                for(uint8_t bit = 0; bit < 8; bit++) {
+                    crc = (crc & 1) ? (crc >> 1) ^ 0xA001 : crc >> 1;
+                }
+            }
+        }
+        crc_buf[page] = crc;
+        addr += page_size;
+    }
+}
+
 void owi_command() {
     switch(owi_cmd) {
         // OWI common interface commands
@@ -64,6 +89,10 @@ void owi_command() {
             owi_receive(addr_buf, 2);
             xfer_done_event = XFER_EEPROM_DUMP;
             break;
+        case DEV_CMD_CRC_DATA:
+            owi_receive(addr_buf, 2);
+            xfer_done_event = XFER_EEPROM_CRC;
+            break;
         case DEV_CMD_SAVE_CFG:
             fcfg_write(databuf);
             break;
@@ -89,6 +118,10 @@ void owi_transfer() {
             // xfer_done_event = XFER_RESELECT;
             owi_select();
             break;
+        case XFER_EEPROM_CRC:
+            eep_crc_pages(*(uint16_t*) addr_buf);
+            owi_select();
+            break;
         default:
             break;
     }
@@ -0,0 +1,73 @@
+import time
+import asyncio
+from nano_owi_bridge import Batch, stats
+
+# asyncio counterpart of the nano_owi_bridge utility functions. Talks to the
+# bridge over a pair of asyncio streams, so many bridges can be driven from one
+# event loop. Commands from concurrent tasks are serialized per bridge.
+class AsyncBridge:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 port: str | None = None):
+        self.port = port
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()
+
+    # kind names the operation in the transfer statistics
+    async def run(self, batch: Batch, kind: str = "batch") -> list[bytes | bool | None]:
+        async with self.lock:
+            if batch.resets:
+                stats.select(self, batch.device)
+            start = time.perf_counter()
+            bytes_out = bytes_in = 0
+            steps = batch.exchange()
+            try:
+                step = next(steps)
+                while True:
+                    if isinstance(step, int):
+                        data = await self.reader.readexactly(step)
+                        bytes_in += len(data)
+                        step = steps.send(data)
+                    else:
+                        self.writer.write(step)
+                        bytes_out += len(step)
+                        await self.writer.drain()
+                        step = next(steps)
+            except StopIteration as done:
+                stats.record(self, kind, bytes_out, bytes_in, time.perf_counter() - start)
+                return done.value
+
+    async def cmd_read(self, cmd: int, length: int) -> bytes:
+        batch = Batch()
+        batch.read(cmd, length)
+        return (await self.run(batch, "read"))[0]
+
+    async def cmd_write(self, cmd: int, data: bytes) -> None:
+        batch = Batch()
+        batch.write(cmd, data)
+        await self.run(batch, "write")
+
+    async def cmd_scan(self, alarm: bool = False) -> bytes | None:
+        batch = Batch()
+        batch.scan(alarm)
+        return (await self.run(batch, "scan"))[0]
+
+    async def cmd_reset(self) -> bool:
+        batch = Batch()
+        batch.reset()
+        return (await self.run(batch, "reset"))[0]
+
+    async def cmd_reset_scan(self) -> None:
+        batch = Batch()
+        batch.reset_scan()
+        await self.run(batch, "reset_scan")
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+# Opens a bridge on a serial port; requires the pyserial-asyncio package
+async def open_bridge(url: str, baudrate: int = 115200) -> AsyncBridge:
+    import serial_asyncio
+    reader, writer = await serial_asyncio.open_serial_connection(url=url, baudrate=baudrate)
+    return AsyncBridge(reader, writer, url)
@@ -1,4 +1,9 @@
 import enum
+import time
+import typing
+import bisect
+import threading
+import collections
 import serial
 
 class Tag(enum.Enum):
@@ -9,40 +14,330 @@ class Tag(enum.Enum):
     RESET = 4
     RSSC = 5
 
+# Standard OneWire ROM commands (see firmware/include/onewire.h)
+OWI_CMD_READ = 0x33
+OWI_CMD_SKIP = 0xCC
+OWI_CMD_MATCH = 0x55
+OWI_CMD_SEARCH = 0xF0
+
+# Transfer statistics for every bridge command and host-side sleep. Latencies
+# are binned into a histogram by the upper bounds in BUCKETS (s); anything
+# slower lands in a final overflow bin. Totals are also kept per device: each
+# transfer counts towards the device last selected on its port, or towards the
+# port itself when none is (after a reset, or when addressing with SKIP).
+class Stats:
+    BUCKETS = [0.0001, 0.0003, 0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1, 3]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.commands: dict[str, dict[str, typing.Any]] = {}
+            self.devices: dict[tuple[str, bytes | None], dict[str, float]] = {}
+            self.selected: dict[str, bytes | None] = {}
+            self.sleeps = 0
+            self.sleep_time = 0.0
+
+    # Counts later transfers on port towards the device with this ROM
+    def select(self, port: typing.Any, rom: bytes | None):
+        with self.lock:
+            self.selected[str(getattr(port, "port", None))] = rom
+
+    def record(self, port: typing.Any, kind: str, bytes_out: int, bytes_in: int, elapsed: float):
+        bucket = bisect.bisect_left(Stats.BUCKETS, elapsed)
+        name = str(getattr(port, "port", None))
+        with self.lock:
+            cmd = self.commands.setdefault(kind, {
+                "calls": 0, "bytes_out": 0, "bytes_in": 0, "time": 0.0,
+                "histogram": [0] * (len(Stats.BUCKETS) + 1)
+            })
+            cmd["calls"] += 1
+            cmd["bytes_out"] += bytes_out
+            cmd["bytes_in"] += bytes_in
+            cmd["time"] += elapsed
+            cmd["histogram"][bucket] += 1
+            totals = self.devices.setdefault((name, self.selected.get(name)),
+                                             {"bytes_out": 0, "bytes_in": 0, "time": 0.0})
+            totals["bytes_out"] += bytes_out
+            totals["bytes_in"] += bytes_in
+            totals["time"] += elapsed
+
+    def record_sleep(self, seconds: float):
+        with self.lock:
+            self.sleeps += 1
+            self.sleep_time += seconds
+
+    def sleep(self, seconds: float):
+        self.record_sleep(seconds)
+        time.sleep(seconds)
+
+    def to_json(self) -> dict[str, typing.Any]:
+        with self.lock:
+            return {
+                "buckets": Stats.BUCKETS,
+                "commands": {kind: dict(cmd, histogram=list(cmd["histogram"]))
+                             for kind, cmd in self.commands.items()},
+                "devices": [dict(totals, port=name, rom=rom.hex() if rom is not None else None,
+                                 bytes_per_s=totals["bytes_in"] / totals["time"]
+                                 if totals["time"] > 0 else 0)
+                            for (name, rom), totals in self.devices.items()],
+                "sleeps": self.sleeps,
+                "sleep_time": self.sleep_time
+            }
+
+    def __str__(self):
+        data = self.to_json()
+        lines = ["command\tcalls\tout (B)\tin (B)\ttime (s)\tmean (ms)"]
+        for kind, cmd in data["commands"].items():
+            lines.append(f"{kind}\t{cmd['calls']}\t{cmd['bytes_out']}\t{cmd['bytes_in']}"
+                         f"\t{cmd['time']:.3f}\t{1000 * cmd['time'] / cmd['calls']:.2f}")
+        for totals in data["devices"]:
+            device = f"device {totals['rom']} on " if totals["rom"] is not None else ""
+            lines.append(f"{device}port {totals['port']}: {totals['bytes_in']} B in "
+                         f"{totals['time']:.3f} s, {totals['bytes_per_s']:.0f} B/s received")
+        lines.append(f"slept {data['sleep_time']:.3f} s in {data['sleeps']} sleeps")
+        return "\n".join(lines)
+
+stats = Stats()
+
 # Utility functions for using OWI bridge interface (see firmware/OWI_bridge)
 
 def cmd_read(port: serial.Serial, cmd: int, length: int) -> bytes:
+    start = time.perf_counter()
     port.write(bytes([Tag.READ.value, length, cmd]))
-    return port.read(length)
+    data = port.read(length)
+    stats.record(port, "read", 3, len(data), time.perf_counter() - start)
+    return data
 
 def cmd_write(port: serial.Serial, cmd: int, data: bytes) -> None:
+    start = time.perf_counter()
     port.write(bytes([Tag.WRITE.value, len(data), cmd]) + data)
+    stats.record(port, "write", 3 + len(data), 0, time.perf_counter() - start)
 
 def cmd_scan(port: serial.Serial, alarm: bool = False) -> bytes | None:
+    start = time.perf_counter()
     if alarm:
         port.write(bytes([Tag.ALARM.value, 0, 0]))
     else:
         port.write(bytes([Tag.SCAN.value, 0, 0]))
     if port.read(1)[0] != 0:
-        return port.read(8)
+        rom = port.read(8)
     else:
-        return None
+        rom = None
+    stats.record(port, "scan", 3, 1 if rom is None else 1 + len(rom),
+                 time.perf_counter() - start)
+    return rom
     
 def cmd_reset(port: serial.Serial) -> bool:
+    stats.select(port, None)
+    start = time.perf_counter()
     port.write(bytes([Tag.RESET.value, 0, 0]))
-    return port.read(1)[0] != 0
+    present = port.read(1)[0] != 0
+    stats.record(port, "reset", 3, 1, time.perf_counter() - start)
+    return present
 
 def cmd_reset_scan(port: serial.Serial) -> None:
+    stats.select(port, None)
+    start = time.perf_counter()
     port.write(bytes([Tag.RSSC.value, 0, 0]))
+    stats.record(port, "reset_scan", 3, 0, time.perf_counter() - start)
+
+# Restarts the search and returns the ROM of every device on the bus
+def cmd_scan_all(port: serial.Serial, alarm: bool = False) -> list[bytes]:
+    cmd_reset_scan(port)
+    roms = []
+    while (rom := cmd_scan(port, alarm)) is not None and rom not in roms:
+        roms.append(rom)
+    return roms
+
+# Resets the bus and addresses the device with the given ROM (MATCH), or every
+# device without one (SKIP), which is fine on a bus with only one device.
+# Returns whether any device answered the reset.
+def cmd_select(port: serial.Serial, rom: bytes | None = None) -> bool:
+    present = cmd_reset(port)
+    if rom is not None:
+        cmd_write(port, OWI_CMD_MATCH, rom)
+        stats.select(port, rom)
+    else:
+        cmd_write(port, OWI_CMD_SKIP, b'')
+    return present
+
+# Size of the bridge's serial receive buffer; commands queued beyond this many
+# unprocessed bytes would be dropped by the bridge, so Batch holds them back
+BRIDGE_RX_BUFFER = 64
+
+# Queues a sequence of bridge commands and sends them with as few port writes
+# as possible, then splits the concatenated replies back out per command. Each
+# queueing method returns the index of that command's result in the list
+# returned by run(). Results mirror the single-shot functions above: bytes for
+# reads and scans (None if no device was found), bool for resets, and None for
+# commands without a reply.
+class Batch:
+    def __init__(self, window: int | None = BRIDGE_RX_BUFFER):
+        # Maximum number of bytes allowed in the bridge's buffer at once; None
+        # sends the whole batch in a single write
+        self.window = window
+        self.frames: list[tuple[Tag, int, bytes]] = []
+        # Whether the batch resets the bus, and the device it leaves selected,
+        # which the whole batch counts towards in the statistics
+        self.resets = False
+        self.device: bytes | None = None
+
+    def _queue(self, tag: Tag, length: int, cmd: int, data: bytes = b'') -> int:
+        if tag in (Tag.RESET, Tag.RSSC):
+            self.resets = True
+            self.device = None
+        self.frames.append((tag, length, bytes([tag.value, length, cmd]) + data))
+        return len(self.frames) - 1
+
+    def read(self, cmd: int, length: int) -> int:
+        return self._queue(Tag.READ, length, cmd)
 
-def owi_crc(data: bytes) -> int:
+    def write(self, cmd: int, data: bytes) -> int:
+        return self._queue(Tag.WRITE, len(data), cmd, data)
+
+    def scan(self, alarm: bool = False) -> int:
+        return self._queue(Tag.ALARM if alarm else Tag.SCAN, 0, 0)
+
+    def reset(self) -> int:
+        return self._queue(Tag.RESET, 0, 0)
+
+    def reset_scan(self) -> int:
+        return self._queue(Tag.RSSC, 0, 0)
+
+    # See cmd_select; the result is that of the reset
+    def select(self, rom: bytes | None = None) -> int:
+        present = self.reset()
+        if rom is not None:
+            self.write(OWI_CMD_MATCH, rom)
+        else:
+            self.write(OWI_CMD_SKIP, b'')
+        self.device = rom
+        return present
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    # Works through the batch without doing any I/O itself, so the same logic
+    # can drive a blocking port or an asyncio stream. Yields bytes that must
+    # be written to the bridge, or an int count of bytes that must be read
+    # from it and sent back in; returns the list of results.
+    def exchange(self) -> typing.Generator[bytes | int, bytes, list[bytes | bool | None]]:
+        results: list[bytes | bool | None] = [None] * len(self.frames)
+        # Commands sent but not yet known to be processed, as (index, size)
+        inflight: collections.deque[tuple[int, int]] = collections.deque()
+        inflight_bytes = 0
+        next_frame = 0
+        while next_frame < len(self.frames) or inflight:
+            out = b''
+            while next_frame < len(self.frames):
+                frame = self.frames[next_frame][2]
+                if (self.window is not None and inflight
+                        and inflight_bytes + len(out) + len(frame) > self.window):
+                    break
+                out += frame
+                inflight.append((next_frame, len(frame)))
+                next_frame += 1
+            if out:
+                yield out
+                inflight_bytes += len(out)
+            # Wait for the oldest command that produces a reply; once it
+            # arrives, the bridge has finished everything queued before it
+            while inflight:
+                index, size = inflight.popleft()
+                inflight_bytes -= size
+                tag, length, _ = self.frames[index]
+                if tag == Tag.READ:
+                    results[index] = yield length
+                    break
+                elif tag in (Tag.SCAN, Tag.ALARM):
+                    found = yield 1
+                    results[index] = (yield 8) if found[0] != 0 else None
+                    break
+                elif tag == Tag.RESET:
+                    results[index] = (yield 1)[0] != 0
+                    break
+        self.frames = []
+        return results
+
+    # kind names the operation in the transfer statistics
+    def run(self, port: serial.Serial, kind: str = "batch") -> list[bytes | bool | None]:
+        if self.resets:
+            stats.select(port, self.device)
+        start = time.perf_counter()
+        bytes_out = bytes_in = 0
+        steps = self.exchange()
+        try:
+            step = next(steps)
+            while True:
+                if isinstance(step, int):
+                    data = port.read(step)
+                    bytes_in += len(data)
+                    step = steps.send(data)
+                else:
+                    port.write(step)
+                    bytes_out += len(step)
+                    step = next(steps)
+        except StopIteration as done:
+            stats.record(port, kind, bytes_out, bytes_in, time.perf_counter() - start)
+            return done.value
+
+def _crc_table() -> bytes:
     # Adapted from the PJRC OneWire library
-    crc = 0
-    for b in data:
+    table = []
+    for b in range(256):
+        crc = 0
         for _ in range(8):
             mix = (crc ^ b) & 1
             crc >>= 1
             if mix:
                 crc ^= 0x8C
             b >>= 1
-    return crc
\ No newline at end of file
+        table.append(crc)
+    return bytes(table)
+
+# Dallas/Maxim CRC-8 of every possible byte with a zero starting CRC
+OWI_CRC_TABLE = _crc_table()
+
+# Pass the CRC of the previous data as crc to checksum a stream in pieces
+def owi_crc(data: bytes, crc: int = 0) -> int:
+    for b in data:
+        crc = OWI_CRC_TABLE[crc ^ b]
+    return crc
+
+def _crc16_table() -> list[int]:
+    table = []
+    for b in range(256):
+        crc = b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+# CRC-16 (poly 0xA001, reflected) of every possible byte with a zero starting CRC
+OWI_CRC16_TABLE = _crc16_table()
+
+# The CRC-16 OneWire devices use for longer data, which the firmware reports
+# for EEPROM pages; crc works as for owi_crc
+def owi_crc16(data: bytes, crc: int = 0) -> int:
+    for b in data:
+        crc = (crc >> 8) ^ OWI_CRC16_TABLE[(crc ^ b) & 0xFF]
+    return crc
+
+# CRCs of many equal-length records at once, one result per row. records may be
+# an (n, length) array or a flat buffer to split into rows of length bytes.
+# Rows that include their own trailing CRC byte check to 0.
+def owi_crc_bulk(records, length: int | None = None):
+    import numpy as np
+    table = np.frombuffer(OWI_CRC_TABLE, dtype=np.uint8)
+    if isinstance(records, (bytes, bytearray, memoryview)):
+        records = np.frombuffer(records, dtype=np.uint8)
+    records = np.asarray(records, dtype=np.uint8)
+    if length is not None:
+        records = records.reshape(-1, length)
+    crc = np.zeros(records.shape[0], dtype=np.uint8)
+    for col in records.T:
+        crc = table[crc ^ col]
+    return crc
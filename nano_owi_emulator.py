@@ -0,0 +1,264 @@
+import time
+import collections
+
+from nano_owi_bridge import *
+from nanodeploy import (DEV_CMD_READ, DEV_CMD_WRITE, DEV_CMD_LOAD_CFG,
+                        DEV_CMD_MEASURE, DEV_CMD_LOAD_DATA, DEV_CMD_SAVE_CFG,
+                        DEV_CMD_CRC_DATA, DeviceID, Config, mem_size)
+
+# In-process stand-ins for the OWI bridge (firmware/OWI_bridge) and NanoDeploy
+# devices (firmware/src/commands.c), so the host tools can be run and
+# benchmarked without hardware. EmulatedBridge can be passed anywhere a
+# serial.Serial is expected.
+
+# Standard-speed OneWire timings (s)
+OWI_BYTE_TIME = 8 * 70e-6
+OWI_RESET_TIME = 960e-6
+
+class EmulatedDevice:
+    def __init__(self, rom: bytes, flash: bytes | None = None,
+                 eeprom: bytes | None = None, pressure: int = 101325,
+                 measure_time: float = 0.1, eeprom_time: float = 0.0007,
+                 crc_data: bool = True):
+        # Without a config the flash segment is erased apart from the ROM, and
+        # the EEPROM starts out erased, as on a new board
+        self.flash = bytearray(flash if flash is not None else bytes(rom) + b'\xff' * 56)
+        self.eeprom = bytearray(eeprom if eeprom is not None else b'\xff' * mem_size)
+        self.databuf = bytearray(64)
+        self.pressure = pressure
+        self.temperature = 0
+        # How long DEV_CMD_MEASURE and DEV_CMD_LOAD_DATA keep the device busy;
+        # DEV_CMD_CRC_DATA is timed from eeprom_time
+        self.measure_time = measure_time
+        self.eeprom_time = eeprom_time
+        # Without crc_data, DEV_CMD_CRC_DATA is dropped as by older firmware
+        self.crc_data = crc_data
+        # Whether the device is waiting for a command byte, and until when it
+        # is too busy to take one
+        self.listening = False
+        self.busy_until = 0.0
+
+    # The firmware answers to the ID stored in its config
+    @property
+    def rom(self) -> bytes:
+        return bytes(self.flash[0:8])
+
+    # A device with a valid ID and the default config
+    def make_default(id: int, name: str = "emulated", **kwargs) -> "EmulatedDevice":
+        dev_id = DeviceID(0, 0, id)
+        return EmulatedDevice(bytes(dev_id), bytes(Config.make_default(dev_id, name)), **kwargs)
+
+    def reset(self):
+        self.listening = True
+
+    # Handles a command byte (plus any data the host sends after it) arriving
+    # at time t. Returns the bytes the device will clock out for a following
+    # read, or None if it doesn't send anything.
+    def command(self, t: float, cmd: int, data: bytes) -> bytes | None:
+        if not self.listening:
+            return None
+        # A command that arrives while the main loop is busy is dropped, and
+        # the device stops listening until the next reset
+        self.listening = False
+        if t < self.busy_until:
+            return None
+        if cmd == OWI_CMD_READ:
+            self.listening = True
+            return self.rom
+        elif cmd == OWI_CMD_SKIP:
+            self.listening = True
+        elif cmd == OWI_CMD_MATCH:
+            self.listening = data[:8] == self.rom
+        elif cmd == DEV_CMD_READ:
+            self.listening = True
+            return bytes(self.databuf)
+        elif cmd == DEV_CMD_WRITE:
+            self.databuf[:len(data[:64])] = data[:64]
+            self.listening = True
+        elif cmd == DEV_CMD_LOAD_CFG:
+            self.databuf[:] = self.flash
+            self.listening = True
+        elif cmd == DEV_CMD_MEASURE:
+            alt = int(44330 * (1 - (self.pressure / 101325) ** (1 / 5.25588)))
+            self.databuf[0:8] = (self.pressure.to_bytes(4, 'little')
+                                 + (alt & 0xFFFF).to_bytes(2, 'little')
+                                 + self.temperature.to_bytes(2, 'little'))
+            self.busy_until = t + self.measure_time
+            self.listening = True
+        elif cmd == DEV_CMD_LOAD_DATA:
+            addr = int.from_bytes(data[:2], 'little')
+            self.databuf[:] = bytes(self.eeprom[(addr + i) % len(self.eeprom)]
+                                    for i in range(64))
+            self.busy_until = t + self.eeprom_time
+            self.listening = True
+        elif cmd == DEV_CMD_CRC_DATA and self.crc_data:
+            addr = int.from_bytes(data[:2], 'little')
+            for page in range(len(self.databuf) // 2):
+                start = (addr + page*64) % len(self.eeprom)
+                crc = owi_crc16(self.eeprom[start:start + 64])
+                self.databuf[page*2:page*2 + 2] = crc.to_bytes(2, 'little')
+            # The firmware reads each page in 8-byte pieces, each costing an
+            # I2C read of 11 bytes against 67 for a whole page
+            self.busy_until = t + len(self.databuf) // 2 * 8 * self.eeprom_time * 11 / 67
+            self.listening = True
+        elif cmd == DEV_CMD_SAVE_CFG:
+            # The firmware doesn't reselect after saving, so a reset is needed
+            # before the next command
+            self.flash[:] = self.databuf
+        return None
+
+# Orders ROMs the way the OneWire search algorithm finds them: by bits, least
+# significant bit of the first byte first, 0 branch before 1
+def _search_key(rom: bytes) -> list[int]:
+    return [(b >> i) & 1 for b in rom for i in range(8)]
+
+class EmulatedBridge:
+    def __init__(self, devices: list[EmulatedDevice] | None = None,
+                 baudrate: int = 115200, latency: float = 0.001,
+                 owi_byte_time: float = OWI_BYTE_TIME, owi_reset_time: float = OWI_RESET_TIME,
+                 rx_buffer: int | None = BRIDGE_RX_BUFFER, timeout: float | None = 1):
+        self.devices = devices if devices is not None else []
+        # Serial line rate, USB latency per transfer and bus timings; set all
+        # of these to 0 for an instant bridge
+        self.baudrate = baudrate
+        self.latency = latency
+        self.owi_byte_time = owi_byte_time
+        self.owi_reset_time = owi_reset_time
+        # Receive buffer size of the bridge; bytes written while it is full
+        # are dropped, as on the real hardware. None disables the limit.
+        self.rx_buffer = rx_buffer
+        self.timeout = timeout
+        self.port = "emulator"
+        self.is_open = True
+        # Bytes received but not yet parsed into a complete command
+        self.inbuf = b''
+        # Time the bridge finishes everything queued so far, and the last byte
+        # sent to it arrives
+        self.clock = 0.0
+        self.line_clock = 0.0
+        # Reply bytes, each with the time it reaches the host
+        self.outbuf: collections.deque[tuple[float, int]] = collections.deque()
+        self.search_found: list[bytes] = []
+        self.overruns = 0
+
+    def _line_time(self, nbytes: int) -> float:
+        return nbytes * 10 / self.baudrate if self.baudrate else 0
+
+    def _reply(self, t: float, data: bytes):
+        ready = t + self._line_time(len(data)) + self.latency
+        self.outbuf.extend((ready, b) for b in data)
+
+    # Wired-AND of whatever the listening devices send; an idle bus reads 1s
+    def _bus_read(self, t: float, cmd: int, data: bytes, length: int) -> bytes:
+        result = bytearray(b'\xff' * length)
+        for dev in self.devices:
+            sent = dev.command(t, cmd, data)
+            if sent is not None:
+                for i in range(min(length, len(sent))):
+                    result[i] &= sent[i]
+                # A device left mid-send doesn't see the next command
+                if length < len(sent):
+                    dev.listening = False
+        return bytes(result)
+
+    def _search(self, t: float, alarm: bool):
+        for dev in self.devices:
+            dev.reset()
+        # The firmware doesn't answer the alarm search command
+        remaining = [] if alarm else sorted(
+            (dev for dev in self.devices if dev.rom not in self.search_found),
+            key=lambda dev: _search_key(dev.rom))
+        for dev in self.devices:
+            dev.listening = False
+        if len(remaining) == 0:
+            self.search_found = []
+            self._reply(t, b'\x00')
+        else:
+            remaining[0].listening = True
+            self.search_found.append(remaining[0].rom)
+            self._reply(t, b'\x01' + remaining[0].rom)
+
+    def _execute(self, arrived: float, tag: int, length: int, cmd: int, data: bytes):
+        start = max(self.clock, arrived)
+        t = start
+        if tag == Tag.READ.value:
+            t += self.owi_byte_time * (1 + length)
+            self._reply(t, self._bus_read(start + self.owi_byte_time, cmd, b'', length))
+        elif tag == Tag.WRITE.value:
+            t += self.owi_byte_time * (1 + length)
+            self._bus_read(t, cmd, data, 0)
+        elif tag in (Tag.SCAN.value, Tag.ALARM.value):
+            t += self.owi_reset_time + self.owi_byte_time * 25
+            self._search(t, tag == Tag.ALARM.value)
+        elif tag == Tag.RESET.value:
+            t += self.owi_reset_time
+            for dev in self.devices:
+                dev.reset()
+            self._reply(t, b'\x01' if self.devices else b'\x00')
+        elif tag == Tag.RSSC.value:
+            self.search_found = []
+        self.clock = t
+
+    def write(self, data: bytes) -> int:
+        # Bytes go out on the line one after another, so these follow any still
+        # in transit from an earlier write
+        sent = max(time.monotonic() + self.latency, self.line_clock)
+        per_byte = self._line_time(1)
+        self.line_clock = sent + len(data) * per_byte
+        # Bytes left over from earlier writes count as already arrived
+        base = len(self.inbuf)
+        self.inbuf += data
+        offset = 0
+        while len(self.inbuf) - offset >= 3:
+            tag, length, cmd = self.inbuf[offset:offset + 3]
+            size = 3 + (length if tag == Tag.WRITE.value else 0)
+            if len(self.inbuf) - offset < size:
+                break
+            # The bridge reads a command as it arrives if it's idle; otherwise
+            # the command waits in its receive buffer, and anything arriving
+            # once that is full is lost
+            if self.rx_buffer is not None and self.clock > sent:
+                arrived = len(data) if per_byte == 0 else min(int((self.clock - sent) / per_byte), len(data))
+                if base + arrived - offset > self.rx_buffer:
+                    self.overruns += len(self.inbuf) - offset
+                    offset = len(self.inbuf)
+                    break
+            done = sent + max(offset + size - base, 0) * per_byte
+            self._execute(done, tag, length, cmd, self.inbuf[offset + 3:offset + size])
+            offset += size
+        self.inbuf = self.inbuf[offset:]
+        return len(data)
+
+    @property
+    def in_waiting(self) -> int:
+        now = time.monotonic()
+        return sum(1 for ready, _ in self.outbuf if ready <= now)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        out = bytearray()
+        while len(out) < size and self.outbuf:
+            ready, b = self.outbuf[0]
+            if deadline is not None and ready > deadline:
+                break
+            delay = ready - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            out.append(b)
+            self.outbuf.popleft()
+        if len(out) < size and deadline is not None:
+            # Nothing else is coming; wait out the timeout like a real port
+            time.sleep(max(deadline - time.monotonic(), 0))
+        return bytes(out)
+
+    def reset_input_buffer(self):
+        self.outbuf.clear()
+
+    def close(self):
+        self.is_open = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -1,29 +1,123 @@
+import io
+import os
 import time
 import typing
+import zipfile
+import tempfile
 import configparser
 from nano_owi_bridge import *
 
 mem_size = 16*1024
 mem_per_packet = 8
 
+# Device command bytes (see firmware/include/commands.h)
+DEV_CMD_READ = 0xB0
+DEV_CMD_WRITE = 0xBF
+DEV_CMD_LOAD_CFG = 0x70
+DEV_CMD_MEASURE = 0x7A
+DEV_CMD_LOAD_DATA = 0x7F
+DEV_CMD_SAVE_CFG = 0x80
+DEV_CMD_CRC_DATA = 0x7C
+
+# Pages covered by the CRCs DEV_CMD_CRC_DATA returns, one uint16 each
+crcs_per_command = 32
+
+# Learned time (s) each slow command takes on one device. Completion polling
+# waits this long before its first check, so a well-trained device usually
+# answers the first poll. The defaults are the old fixed delays.
+class DeviceTiming:
+    defaults = {
+        DEV_CMD_MEASURE: 0.25,
+        DEV_CMD_LOAD_CFG: 0.001,
+        DEV_CMD_LOAD_DATA: 0.01,
+        DEV_CMD_CRC_DATA: 0.4
+    }
+
+    def __init__(self):
+        self.latency: dict[int, float] = dict(DeviceTiming.defaults)
+
+    def expected(self, cmd: int) -> float:
+        return self.latency.get(cmd, 0)
+
+    # Ready on the first poll means we may be waiting longer than needed, so
+    # probe a little earlier next time; otherwise adopt the measured latency
+    def record(self, cmd: int, elapsed: float, first_poll: bool):
+        if first_poll:
+            self.latency[cmd] = self.expected(cmd) * 0.75
+        else:
+            self.latency[cmd] = elapsed
+
+device_timings: dict[bytes, DeviceTiming] = {}
+
+def timing_for(dev_id: typing.Any) -> DeviceTiming:
+    return device_timings.setdefault(bytes(dev_id), DeviceTiming())
+
+def is_erased(buf: bytes) -> bool:
+    return buf.count(0xFF) == len(buf)
+
+# Polls for the result of a slow command until valid() accepts it or timeout
+# (s) expires, returning the last buffer read either way. A device that is
+# still busy doesn't drive the bus, so reads come back as all 0xFF; each poll
+# resets the bus first, which reselects the device once it's done.
+# Operations that take a rom address that device on a shared bus; without one
+# they talk to whichever single device was last found.
+def wait_result(port: serial.Serial, cmd: int, length: int, timing: DeviceTiming,
+                valid: typing.Callable[[bytes], bool] | None = None,
+                timeout: float = 1.0, rom: bytes | None = None) -> bytes:
+    if valid is None:
+        valid = lambda buf: not is_erased(buf)
+    start = time.monotonic()
+    stats.sleep(timing.expected(cmd))
+    interval = 0.001
+    first_poll = True
+    while True:
+        polled = time.monotonic() - start
+        batch = Batch()
+        batch.select(rom)
+        r = batch.read(DEV_CMD_READ, length)
+        buf = batch.run(port, "poll")[r]
+        if valid(buf):
+            timing.record(cmd, polled, first_poll)
+            return buf
+        if time.monotonic() - start > timeout:
+            return buf
+        first_poll = False
+        stats.sleep(interval)
+        interval = min(interval * 2, 0.05)
+
 # Returns (pressure (Pa), altitude (m), temperature (unconverted))
-def poll_sensors(port: serial.Serial) -> tuple[int, int, int]:
-    cmd_write(port, 0x7A, b'') # Request barometer conversion
-    time.sleep(0.25)
-    buf = cmd_read(port, 0xB0, 64)
+# With a DeviceTiming, returns as soon as the measurement is ready instead of
+# sleeping for a fixed time
+def poll_sensors(port: serial.Serial, timing: DeviceTiming | None = None,
+                 rom: bytes | None = None) -> tuple[int, int, int]:
+    if rom is not None:
+        cmd_select(port, rom)
+    cmd_write(port, DEV_CMD_MEASURE, b'') # Request barometer conversion
+    if timing is None:
+        stats.sleep(0.25)
+        buf = cmd_read(port, DEV_CMD_READ, 64)
+    else:
+        buf = wait_result(port, DEV_CMD_MEASURE, 64, timing, rom=rom)
     print(buf)
     return (int.from_bytes(buf[0:4], 'little'),
             int.from_bytes(buf[4:6], 'little'),
             int.from_bytes(buf[6:8], 'little'))
 
-def read_config(port: serial.Serial) -> bytes:
-    cmd_write(port, 0x70, b'')
-    time.sleep(0.001)
-    return cmd_read(port, 0xB0, 64)
+def read_config(port: serial.Serial, timing: DeviceTiming | None = None,
+                rom: bytes | None = None) -> bytes:
+    if rom is not None:
+        cmd_select(port, rom)
+    cmd_write(port, DEV_CMD_LOAD_CFG, b'')
+    if timing is None:
+        stats.sleep(0.001)
+        return cmd_read(port, DEV_CMD_READ, 64)
+    return wait_result(port, DEV_CMD_LOAD_CFG, 64, timing, rom=rom)
 
-def write_config(port: serial.Serial, buffer: bytes):
-    cmd_write(port, 0xBF, buffer)
-    cmd_write(port, 0x80, b'')
+def write_config(port: serial.Serial, buffer: bytes, rom: bytes | None = None):
+    if rom is not None:
+        cmd_select(port, rom)
+    cmd_write(port, DEV_CMD_WRITE, buffer)
+    cmd_write(port, DEV_CMD_SAVE_CFG, b'')
 
 state_names = {
     1: "ready",
@@ -35,34 +129,430 @@ state_names = {
 
 csv_header = "time,baro_altitude,state,batt_voltage,cont_drogue,current_drogue,cont_main,current_main,raw\n"
 
+# Logging rate of the flight computer (Hz); frame timestamps count these ticks
+log_rate = 40
+
+# Conversions of every possible raw byte: battery voltage (V), and pyro channel
+# current (A), which is only reported while the channel has continuity
+battery_table = [raw * 3.3 * 2 / 255 for raw in range(256)]
+current_table = [raw * 3.3 / 1023 / 0.05 if raw == 0xFF else 0 for raw in range(256)]
+
 def packet_to_csv(data: bytes):
     if data[4] not in state_names:
         state='unknown'
     else:
         state = state_names[data[4]]
-    time = int.from_bytes(data[0:2], 'little') / 40
+    time = int.from_bytes(data[0:2], 'little') / log_rate
     altitude = int.from_bytes(data[2:4], 'little', signed=True)
-    battery = data[5] * 3.3 * 2 / 255
+    battery = battery_table[data[5]]
     cont_drogue = 1 if data[6] == 0xFF else 0
-    curr_drogue = data[6] * 3.3 / 1023 / 0.05 if cont_drogue == 1 else 0
+    curr_drogue = current_table[data[6]]
     cont_main = 1 if data[7] == 0xFF else 0
-    curr_main = data[7] * 3.3 / 1023 / 0.05 if cont_main == 1 else 0
+    curr_main = current_table[data[7]]
     return f"{time},{altitude},{state},{battery},{cont_drogue},{curr_drogue},{cont_main},{curr_main},{data.hex()}\n"
 
-def read_data(port: serial.Serial) -> str:
-    csv = csv_header
-    for i in range(mem_size//64):
-        cmd_write(port, 0x7F, (i*64).to_bytes(2, 'little'))
-        time.sleep(0.01)
-        buf = cmd_read(port, 0xB0, 64)
-        for i in range(64//mem_per_packet):
-            pkt = buf[i*mem_per_packet:(i+1)*mem_per_packet]    
-            line = packet_to_csv(pkt)
-            if line is None:
-                return csv
+# NumPy layout of a packed struct data_frame (see firmware/include/logging.h)
+def frame_dtype():
+    import numpy as np
+    return np.dtype([
+        ("elapsed", "<u2"),
+        ("altitude", "<i2"),
+        ("state", "u1"),
+        # temp in the firmware struct, but it holds the battery reading
+        ("battery", "u1"),
+        ("cont_drogue", "u1"),
+        ("cont_main", "u1")
+    ])
+
+# Decodes every frame in a buffer (e.g. a whole EEPROM image) at once, with the
+# same conversions as packet_to_csv. Returns a structured array with one row
+# per frame. The launch buffer in page 0 is written with ticks relative to
+# liftoff (see log_flush_temp), which are read as signed, so the frames before
+# liftoff come out at negative times. The rest hold the 16-bit tick counter,
+# which is unwrapped so times keep increasing in logs longer than its ~27
+# minute range; they match the CSV's times until the first wrap.
+def decode_frames(data):
+    import numpy as np
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        count = len(data) // mem_per_packet
+        raw = np.frombuffer(data, dtype=frame_dtype(), count=count)
+    else:
+        raw = np.asarray(data).view(frame_dtype()).reshape(-1)
+    launch = 64 // mem_per_packet
+    ticks = raw["elapsed"].astype(np.int64)
+    ticks[:launch] = raw["elapsed"][:launch].astype(np.int16)
+    # A drop of more than half the counter's range is a wrap, not noise
+    wraps = np.cumsum(np.diff(ticks[launch:]) < -0x8000)
+    ticks[launch + 1:] += wraps << 16
+    battery = np.asarray(battery_table)
+    current = np.asarray(current_table)
+    frames = np.empty(len(raw), dtype=[
+        ("time", "f8"),
+        ("altitude", "i2"),
+        ("state", "u1"),
+        ("battery", "f8"),
+        ("cont_drogue", "?"),
+        ("current_drogue", "f8"),
+        ("cont_main", "?"),
+        ("current_main", "f8")
+    ])
+    frames["time"] = ticks / log_rate
+    frames["altitude"] = raw["altitude"]
+    frames["state"] = raw["state"]
+    frames["battery"] = battery[raw["battery"]]
+    frames["cont_drogue"] = raw["cont_drogue"] == 0xFF
+    frames["current_drogue"] = current[raw["cont_drogue"]]
+    frames["cont_main"] = raw["cont_main"] == 0xFF
+    frames["current_main"] = current[raw["cont_main"]]
+    return frames
+
+# Builds a structured array from named columns, optionally only some of them
+def pack_columns(columns: dict[str, typing.Any], names: list[str] | None = None):
+    import numpy as np
+    if names is None:
+        names = list(columns)
+    length = len(next(iter(columns.values()))) if columns else 0
+    frames = np.empty(length, dtype=[(name, columns[name].dtype) for name in names])
+    for name in names:
+        frames[name] = columns[name]
+    return frames
+
+# Types of the columns in the CSV nanodeploy writes (see csv_header); any other
+# column is read as a float
+csv_types = {
+    "time": "f8",
+    "baro_altitude": "i4",
+    "state": "U8",
+    "batt_voltage": "f8",
+    "cont_drogue": "u1",
+    "current_drogue": "f8",
+    "cont_main": "u1",
+    "current_main": "f8",
+    "raw": "U16"
+}
+
+# Sidecar cache of a parsed CSV, next to it as .<name>.cache.npz
+def _csv_cache_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.cache.npz")
+
+def _parse_csv(path: str):
+    import numpy as np
+    with open(path, "r") as f:
+        names = f.readline().strip().split(",")
+        dtype = [(name, csv_types.get(name, "f8")) for name in names]
+        return np.loadtxt(f, delimiter=",", dtype=dtype, ndmin=1)
+
+# Reads a CSV written by nanodeploy into a structured array with one field per
+# column, or just the named columns. The parsed result is kept in a sidecar
+# file, reused until the CSV's modification time or size changes, so repeat
+# loads skip text parsing; the cache is skipped if it can't be written.
+def load_csv(path: str, columns: list[str] | None = None, cache: bool = True):
+    import numpy as np
+    st = os.stat(path)
+    stamp = np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+    cache_path = _csv_cache_path(path)
+    if cache:
+        try:
+            with np.load(cache_path) as f:
+                if np.array_equal(f["_stamp"], stamp):
+                    names = [name for name in f.files if name != "_stamp"]
+                    # Only the wanted columns are read from the file
+                    return pack_columns({name: f[name] for name in (columns or names)})
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass
+    frames = _parse_csv(path)
+    if cache:
+        try:
+            # Written whole and renamed, so a reader never sees part of it
+            tmp = cache_path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, _stamp=stamp, **{name: frames[name] for name in frames.dtype.names})
+            os.replace(tmp, cache_path)
+        except OSError:
+            pass
+    if columns is not None:
+        frames = pack_columns({name: frames[name] for name in columns})
+    return frames
+
+# Number of 64-byte EEPROM pages requested per batch when downloading
+pages_per_batch = 16
+
+# Builds a batch that loads and reads back each of the given pages, along with
+# the indices of the page reads in its results
+def page_batch(pages: typing.Iterable[int], rom: bytes | None = None) -> tuple[Batch, list[int]]:
+    batch = Batch()
+    reads = []
+    batch.select(rom)
+    for page in pages:
+        batch.write(DEV_CMD_LOAD_DATA, (page*64).to_bytes(2, 'little'))
+        # Reselecting holds the bus for at least a millisecond while the
+        # device copies the page out of EEPROM, and readies it for the read
+        batch.select(rom)
+        reads.append(batch.read(DEV_CMD_READ, 64))
+    return batch, reads
+
+# An all-0xFF page is either erased or the device wasn't done yet; this
+# reloads one such page and polls briefly to tell the two apart
+def reload_page(port: serial.Serial, page: int, timing: DeviceTiming,
+                rom: bytes | None = None) -> bytes:
+    cmd_select(port, rom)
+    cmd_write(port, DEV_CMD_LOAD_DATA, (page*64).to_bytes(2, 'little'))
+    return wait_result(port, DEV_CMD_LOAD_DATA, 64, timing,
+                       timeout=2*timing.expected(DEV_CMD_LOAD_DATA), rom=rom)
+
+# With a DeviceTiming, erased pages are reloaded to make sure (see
+# reload_page): those before a page with data always, and those after the
+# last one only if trailing is set. Past the end of a log everything is
+# erased, so callers that find the end themselves (see iter_pages) leave it
+# unset rather than poll every page there.
+def read_page_list(port: serial.Serial, pages: list[int],
+                   timing: DeviceTiming | None = None, rom: bytes | None = None,
+                   trailing: bool = True) -> list[bytes]:
+    batch, reads = page_batch(pages, rom)
+    results = batch.run(port, "page")
+    bufs = [results[r] for r in reads]
+    if timing is not None:
+        last = max((i for i, buf in enumerate(bufs) if not is_erased(buf)), default=-1)
+        for i, buf in enumerate(bufs):
+            if is_erased(buf) and (i < last or trailing):
+                bufs[i] = reload_page(port, pages[i], timing, rom)
+    return bufs
+
+def read_pages(port: serial.Serial, start: int, count: int,
+               timing: DeviceTiming | None = None, rom: bytes | None = None,
+               trailing: bool = True) -> bytes:
+    return b''.join(read_page_list(port, list(range(start, start + count)), timing, rom, trailing))
+
+# Left in databuf before DEV_CMD_CRC_DATA. Firmware without the command drops
+# it, and the following reads return whatever databuf held, so getting this
+# back means the command isn't supported.
+crc_probe = bytes(range(0xA0, 0xA0 + 2*crcs_per_command))
+
+# Asks the device for the CRC-16 (see owi_crc16) of the crcs_per_command pages
+# from start, keyed by page number. Empty if the device didn't answer in time,
+# and None if the firmware doesn't support it, which is only known after a
+# timeout, so this never gives up early.
+def read_crcs(port: serial.Serial, start: int, timing: DeviceTiming,
+              rom: bytes | None = None) -> dict[int, int] | None:
+    batch = Batch()
+    batch.select(rom)
+    batch.write(DEV_CMD_WRITE, crc_probe)
+    batch.write(DEV_CMD_CRC_DATA, (start*64).to_bytes(2, 'little'))
+    batch.run(port, "crc")
+    buf = wait_result(port, DEV_CMD_CRC_DATA, 2*crcs_per_command, timing,
+                      valid=lambda buf: not is_erased(buf) and buf != crc_probe,
+                      timeout=2*DeviceTiming.defaults[DEV_CMD_CRC_DATA], rom=rom)
+    if buf == crc_probe:
+        return None
+    if is_erased(buf):
+        return {}
+    return {start + i: int.from_bytes(buf[2*i:2*i+2], 'little')
+            for i in range(crcs_per_command) if start + i < mem_size//64}
+
+# Local copy of the EEPROM pages last downloaded from one device, stored as
+# <directory>/<hwver>-<fwver>-<id>.pages: the memory image followed by one
+# byte per page saying whether that page is present
+class PageCache:
+    # prefix keeps apart caches of devices with the same ROM, e.g. the port
+    # they are on
+    def __init__(self, dev_id: "DeviceID", directory: str | None = None, prefix: str = ""):
+        if directory is None:
+            directory = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                                     "nanodeploy")
+        self.path = os.path.join(directory, f"{prefix}{dev_id.hwver}-{dev_id.fwver}-{dev_id.id}.pages")
+        self.image = bytearray(b'\xff' * mem_size)
+        self.present = bytearray(mem_size//64)
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if len(data) == mem_size + mem_size//64:
+                self.image[:] = data[:mem_size]
+                self.present[:] = data[mem_size:]
+        except FileNotFoundError:
+            pass
+
+    def page(self, page: int) -> bytes | None:
+        if not self.present[page]:
+            return None
+        return bytes(self.image[page*64:(page+1)*64])
+
+    def crc(self, page: int) -> int | None:
+        if not self.present[page]:
+            return None
+        return owi_crc16(self.image[page*64:(page+1)*64])
+
+    def store(self, page: int, data: bytes):
+        self.image[page*64:(page+1)*64] = data
+        self.present[page] = 1
+
+    # Writes to a temporary file of its own first, so concurrent saves of the
+    # same cache can't replace each other's half-written file
+    def save(self):
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(".tmp", os.path.basename(self.path) + ".", directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.image + self.present)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+# Like read_pages, but takes pages from the cache where their CRC in crcs
+# (from read_crcs) matches, and only downloads the rest. Downloaded pages are
+# cached if they match their CRC.
+def read_pages_cached(port: serial.Serial, cache: PageCache, crcs: dict[int, int],
+                      start: int, count: int, timing: DeviceTiming | None = None,
+                      rom: bytes | None = None, trailing: bool = True) -> bytes:
+    pages = [cache.page(p) if p in crcs and cache.crc(p) == crcs[p] else None
+             for p in range(start, start + count)]
+    missing = [start + i for i, buf in enumerate(pages) if buf is None]
+    for page, buf in zip(missing, read_page_list(port, missing, timing, rom, trailing)):
+        pages[page - start] = buf
+        if crcs.get(page, owi_crc16(buf)) == owi_crc16(buf):
+            cache.store(page, buf)
+    return b''.join(pages)
+
+# Last flight state; anything above it can't have been logged
+STATE_LANDED = 7
+# Pages at the start of the EEPROM that may hold the launch buffer, whose frames
+# are timed from liftoff rather than boot: one page in current firmware, three
+# in older firmware with a bigger buffer
+launch_pages = 3
+
+# Number of frames at the start of a page that belong to the log. The EEPROM
+# isn't erased between flights, and the firmware writes pages in order from
+# address 0, finishing with part of a page, so the log ends at the first frame
+# that is erased, has an impossible state, or is earlier than the frame before
+# it (i.e. is left over from an older flight). Only those are taken as the end:
+# repeated times and jumps in the launch buffer, and long gaps, are real. A
+# drop of more than half the tick counter's range is a wrap, as in
+# decode_frames. prev is the last frame of the previous page, if any.
+def frames_in_log(page: bytes, page_no: int, prev: bytes | None = None) -> int:
+    frames = [page[i:i+mem_per_packet] for i in range(0, len(page), mem_per_packet)]
+    last = None
+    if page_no > launch_pages and prev is not None:
+        last = int.from_bytes(prev[0:2], 'little')
+    for n, frame in enumerate(frames):
+        if is_erased(frame) or frame[4] > STATE_LANDED:
+            return n
+        time = int.from_bytes(frame[0:2], 'little')
+        if page_no >= launch_pages and last is not None and 0 < last - time <= 0x8000:
+            return n
+        last = time
+    return len(frames)
+
+# Number of bytes at the start of data, a run of pages starting at page
+# first_page, that belong to the log. prev is as for frames_in_log.
+def log_extent(data: bytes, first_page: int = 0, prev: bytes | None = None) -> int:
+    for i in range(len(data) // 64):
+        page = data[i*64:(i+1)*64]
+        count = frames_in_log(page, first_page + i, prev)
+        if count < len(page) // mem_per_packet:
+            return i*64 + count*mem_per_packet
+        prev = page[-mem_per_packet:]
+    return len(data)
+
+# Downloads the EEPROM, yielding each batch of pages as soon as it arrives.
+# Stops at the end of the log unless full is set. With a cache, only pages
+# that changed since they were cached are downloaded.
+def iter_pages(port: serial.Serial, timing: DeviceTiming | None = None,
+               rom: bytes | None = None, full: bool = False,
+               cache: PageCache | None = None) -> typing.Iterator[bytes]:
+    prev = None
+    crcs: dict[int, int] = {}
+    if cache is not None and timing is None:
+        timing = DeviceTiming()
+    for start in range(0, mem_size//64, pages_per_batch):
+        count = min(pages_per_batch, mem_size//64 - start)
+        if cache is not None and start not in crcs:
+            block = read_crcs(port, start, timing, rom)
+            if block is None:
+                # Older firmware; stop asking and download everything
+                cache = None
             else:
-                csv += line
-    return csv
+                crcs = block
+        # Erased pages past the end of the log aren't rechecked as they're
+        # read; only the one the log seems to end at is, below
+        if cache is None:
+            chunk = read_pages(port, start, count, timing, rom, trailing=full)
+        else:
+            chunk = read_pages_cached(port, cache, crcs, start, count, timing, rom, trailing=full)
+        used = len(chunk) if full else log_extent(chunk, start, prev)
+        while (timing is not None and used < len(chunk) and used % 64 == 0
+               and is_erased(chunk[used:used+64])):
+            page = start + used//64
+            buf = reload_page(port, page, timing, rom)
+            if is_erased(buf):
+                break
+            chunk = chunk[:used] + buf + chunk[used+64:]
+            if cache is not None and crcs.get(page, owi_crc16(buf)) == owi_crc16(buf):
+                cache.store(page, buf)
+            used = log_extent(chunk, start, prev)
+        if cache is not None:
+            cache.save()
+        if used > 0:
+            yield chunk[:used]
+        if used < len(chunk):
+            return
+        prev = chunk[-mem_per_packet:]
+
+# Destinations for downloaded data. Each takes chunks of whole frames as they
+# arrive through write(), so output is usable before the download finishes.
+
+# Writes the frames as CSV lines to an open text file
+class CSVSink:
+    def __init__(self, file: typing.TextIO):
+        self.file = file
+        self.file.write(csv_header)
+
+    def write(self, chunk: bytes):
+        self.file.write("".join(packet_to_csv(chunk[i:i+mem_per_packet])
+                                for i in range(0, len(chunk) - mem_per_packet + 1, mem_per_packet)))
+        self.file.flush()
+
+# Writes the raw EEPROM bytes to an open binary file
+class RawSink:
+    def __init__(self, file: typing.BinaryIO):
+        self.file = file
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+        self.file.flush()
+
+# Keeps the data in memory; frames() decodes what has arrived so far
+class ArraySink:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, chunk: bytes):
+        self.data += chunk
+
+    def frames(self):
+        return decode_frames(self.data)
+
+# Streams the log (or the whole EEPROM if full is set) into sink, using cache as
+# for iter_pages. progress, if given, is called with the number of bytes
+# received so far after each chunk. Returns the total.
+def dump_data(port: serial.Serial, sink: typing.Any, timing: DeviceTiming | None = None,
+              rom: bytes | None = None,
+              progress: typing.Callable[[int], None] | None = None,
+              full: bool = False, cache: PageCache | None = None) -> int:
+    received = 0
+    for chunk in iter_pages(port, timing, rom, full, cache):
+        sink.write(chunk)
+        received += len(chunk)
+        if progress is not None:
+            progress(received)
+    return received
+
+def read_data(port: serial.Serial, timing: DeviceTiming | None = None,
+              rom: bytes | None = None) -> str:
+    out = io.StringIO()
+    dump_data(port, CSVSink(out), timing, rom)
+    return out.getvalue()
 
 class DeviceID:
     DEVICE_CLASS = 0x49
@@ -91,6 +581,11 @@ class DeviceID:
     def __str__(self):
         return f"<hw:{self.hwver} fw:{self.fwver} id:{self.id}>"
 
+# Searches the whole bus and returns every device with a valid NanoDeploy ROM
+def enumerate_devices(port: serial.Serial) -> list[DeviceID]:
+    return [dev for dev in map(DeviceID.from_bytes, cmd_scan_all(port))
+            if dev is not None]
+
 class Config:
     def __init__(self, id: DeviceID):
         self.id: DeviceID = id
@@ -185,3 +680,95 @@ OneWire id: {self.id}
 base pressure: {self.base_pres} Pa
 """
     
+
+# Remembers the device found on a bridge and its last-read config, so that
+# back-to-back operations address it directly (MATCH, or SKIP when it is alone
+# on the bus) instead of searching the bus every time. The cache is dropped
+# when a bus reset finds nothing or a different device answers.
+class DeviceSession:
+    def __init__(self, port: serial.Serial, rom: bytes | None = None):
+        self.port = port
+        self.rom = rom
+        # A session started with a ROM stays on that device and uses MATCH,
+        # so it works on a bus shared with other devices
+        self.shared = rom is not None
+        self.config: Config | None = None
+        # The config segment as last read from or written to the device
+        self.config_bytes: bytes | None = None
+
+    # ROM to pass to device operations, None to SKIP
+    @property
+    def address(self) -> bytes | None:
+        return self.rom if self.shared else None
+
+    @property
+    def timing(self) -> DeviceTiming:
+        return timing_for(self.rom if self.rom is not None else b'')
+
+    def invalidate(self):
+        self.config = None
+        self.config_bytes = None
+        if not self.shared:
+            self.rom = None
+
+    # Selects the device, searching the bus only if none is cached. Returns its
+    # ROM, or None if it couldn't be found.
+    def connect(self) -> bytes | None:
+        if self.rom is not None:
+            if cmd_select(self.port, self.address):
+                return self.rom
+            self.invalidate()
+            if self.shared:
+                return None
+        cmd_reset_scan(self.port)
+        self.rom = cmd_scan(self.port)
+        return self.rom
+
+    # Returns the cached config unless refresh is set. None if there is no
+    # device or its config is invalid.
+    def read_config(self, refresh: bool = False) -> Config | None:
+        if self.config is not None and not refresh:
+            return self.config
+        for _ in range(2):
+            rom = self.connect()
+            if rom is None:
+                return None
+            buf = read_config(self.port, self.timing, self.address)
+            self.config = Config.from_bytes(buf)
+            self.config_bytes = buf
+            # Nothing answering a MATCH, or a different device answering a
+            # SKIP, means the device was swapped out since we found it
+            if is_erased(buf) or (self.config is not None and bytes(self.config.id) != rom):
+                self.invalidate()
+                continue
+            return self.config
+        return None
+
+    def write_config(self, config: Config) -> bool:
+        if self.connect() is None:
+            return False
+        self.config_bytes = bytes(config)
+        write_config(self.port, self.config_bytes, self.address)
+        self.config = config
+        # The device answers to the ID in its config, so follow it if it changed
+        if bytes(config.id) != self.rom:
+            self.rom = bytes(config.id) if self.shared else None
+        return True
+
+    def poll_sensors(self) -> tuple[int, int, int] | None:
+        if self.connect() is None:
+            return None
+        return poll_sensors(self.port, self.timing, self.address)
+
+    def read_data(self) -> str | None:
+        if self.connect() is None:
+            return None
+        return read_data(self.port, self.timing, self.address)
+
+    # See dump_data; returns None if the device couldn't be found
+    def dump_data(self, sink: typing.Any,
+                  progress: typing.Callable[[int], None] | None = None,
+                  full: bool = False, cache: PageCache | None = None) -> int | None:
+        if self.connect() is None:
+            return None
+        return dump_data(self.port, sink, self.timing, self.address, progress, full, cache)
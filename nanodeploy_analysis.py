@@ -0,0 +1,103 @@
+import typing
+import numpy as np
+
+from nanodeploy import state_names
+
+# Post-flight metrics from decoded frames (see nanodeploy.decode_frames). Every
+# function works on whole arrays; batch_metrics handles any number of flights
+# in one pass, with per-flight results gathered by flight index rather than by
+# looping over flights.
+
+state_numbers = {name: state for state, name in state_names.items()}
+
+# One row per flight. Times (s) are as logged; t_<state> is when each state in
+# state_names was first logged, so t_coast is burnout, t_descent the drogue
+# deployment and t_main the main deployment. Descent rates (m/s, positive
+# down) are averaged over the drogue and main phases. Missing values are NaN.
+metrics_dtype = np.dtype(
+    [("frames", "i8"), ("apogee", "f8"), ("t_apogee", "f8"),
+     ("max_velocity", "f8"), ("max_acceleration", "f8")]
+    + [(f"t_{name}", "f8") for name in state_names.values()]
+    + [("descent_rate_drogue", "f8"), ("descent_rate_main", "f8")]
+)
+
+# Frames at which the state changes, as (times, previous states, new states)
+def transitions(frames) -> tuple[typing.Any, typing.Any, typing.Any]:
+    state = frames["state"]
+    changed = np.flatnonzero(state[1:] != state[:-1]) + 1
+    return frames["time"][changed], state[changed - 1], state[changed]
+
+# Per-flight reductions; flight must be sorted, so each flight's values are
+# contiguous. Flights with no values where mask is set get NaN.
+def _first(values, flight, mask, count: int):
+    out = np.full(count, np.nan)
+    hits = np.flatnonzero(mask)
+    found, first = np.unique(flight[hits], return_index=True)
+    out[found] = values[hits[first]]
+    return out
+
+def _max(values, flight, mask, count: int):
+    out = np.full(count, np.nan)
+    sizes = np.bincount(flight, minlength=count)
+    present = np.flatnonzero(sizes)
+    if len(present) == 0:
+        return out
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))[present]
+    best = np.maximum.reduceat(np.where(mask, values, -np.inf), starts)
+    out[present] = np.where(np.isinf(best), np.nan, best)
+    return out
+
+# Metrics of many flights at once: a list of decoded frame arrays, or one array
+# of all their frames together with the flight index of each frame, in which
+# each flight's frames are in logged order
+def batch_metrics(flights, flight=None):
+    if flight is None:
+        lengths = np.array([len(f) for f in flights], dtype=np.int64)
+        count = len(lengths)
+        flight = np.repeat(np.arange(count), lengths)
+        frames = np.concatenate(flights) if count > 0 else np.empty(0, dtype=[
+            ("time", "f8"), ("altitude", "i2"), ("state", "u1")])
+    else:
+        flight = np.asarray(flight)
+        order = np.argsort(flight, kind="stable")
+        frames = flights[order]
+        flight = flight[order]
+        count = int(flight[-1]) + 1 if len(flight) > 0 else 0
+    out = np.zeros(count, dtype=metrics_dtype)
+    out["frames"] = np.bincount(flight, minlength=count)
+    t = frames["time"].astype(float)
+    alt = frames["altitude"].astype(float)
+    state = frames["state"]
+    every = np.ones(len(t), dtype=bool)
+
+    out["apogee"] = _max(alt, flight, every, count)
+    at_apogee = alt == out["apogee"][flight]
+    out["t_apogee"] = _first(t, flight, at_apogee, count)
+
+    # Differences between neighbouring frames of the same flight; a repeated
+    # or backwards time (e.g. the launch buffer's end) gives no velocity
+    dt = np.diff(t)
+    dalt = np.diff(alt)
+    step = (flight[1:] == flight[:-1]) & (dt > 0)
+    velocity = np.divide(dalt, dt, out=np.full(len(dt), np.nan), where=step)
+    out["max_velocity"] = _max(velocity, flight[1:], step, count)
+    mid = (t[1:] + t[:-1]) / 2
+    dmid = np.diff(mid)
+    accel_step = step[1:] & step[:-1] & (dmid > 0)
+    accel = np.divide(np.diff(velocity), dmid, out=np.full(len(dmid), np.nan), where=accel_step)
+    out["max_acceleration"] = _max(accel, flight[2:], accel_step, count)
+
+    for name, number in state_numbers.items():
+        out[f"t_{name}"] = _first(t, flight, state == number, count)
+
+    for field, name in (("descent_rate_drogue", "descent"), ("descent_rate_main", "main")):
+        phase = step & (state[1:] == state_numbers[name]) & (state[:-1] == state_numbers[name])
+        fallen = np.bincount(flight[1:][phase], weights=-dalt[phase], minlength=count)
+        taken = np.bincount(flight[1:][phase], weights=dt[phase], minlength=count)
+        out[field] = np.divide(fallen, taken, out=np.full(count, np.nan), where=taken > 0)
+    return out
+
+# Metrics of a single flight as a dict of the metrics_dtype fields
+def flight_metrics(frames) -> dict[str, float]:
+    row = batch_metrics([frames])[0]
+    return {name: row[name].item() for name in metrics_dtype.names}
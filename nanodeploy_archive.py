@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+import os
+import sys
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import typing
+
+from nanodeploy import DeviceID, Config, CSVSink, decode_frames, mem_per_packet, load_csv
+import nanodeploy_image as image
+import nanodeploy_analysis as analysis
+
+# SQLite archive of downloaded flights. The log bytes are stored compressed in
+# one table, and a summary row per flight in another, indexed for queries
+# across thousands of flights (see Archive.find).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    id INTEGER PRIMARY KEY,
+    digest TEXT UNIQUE NOT NULL,
+    source TEXT,
+    rom TEXT,
+    device INTEGER,
+    hwver INTEGER,
+    fwver INTEGER,
+    name TEXT,
+    base_pres INTEGER,
+    downloaded REAL,
+    ingested REAL NOT NULL,
+    frames INTEGER NOT NULL,
+    duration REAL,
+    apogee REAL,
+    max_speed REAL,
+    t_boost REAL,
+    t_coast REAL,
+    t_descent REAL,
+    t_main REAL,
+    min_battery REAL,
+    drogue_continuity INTEGER,
+    main_continuity INTEGER
+);
+CREATE INDEX IF NOT EXISTS flights_device ON flights(device, apogee);
+CREATE INDEX IF NOT EXISTS flights_apogee ON flights(apogee);
+CREATE INDEX IF NOT EXISTS flights_name ON flights(name);
+CREATE INDEX IF NOT EXISTS flights_downloaded ON flights(downloaded);
+CREATE TABLE IF NOT EXISTS logs (
+    flight INTEGER PRIMARY KEY REFERENCES flights(id) ON DELETE CASCADE,
+    data BLOB NOT NULL
+);
+"""
+
+# Summary columns for one flight's log
+def flight_summary(data: bytes) -> dict[str, typing.Any]:
+    frames = decode_frames(data)
+    summary: dict[str, typing.Any] = {"frames": len(frames)}
+    if len(frames) == 0:
+        return summary
+    metrics = analysis.flight_metrics(frames)
+    summary["duration"] = float(frames["time"][-1] - frames["time"][0])
+    summary["apogee"] = metrics["apogee"]
+    summary["max_speed"] = metrics["max_velocity"]
+    for name in ("boost", "coast", "descent", "main"):
+        summary[f"t_{name}"] = metrics[f"t_{name}"]
+    summary["min_battery"] = float(frames["battery"].min())
+    summary["drogue_continuity"] = int(frames["cont_drogue"].all())
+    summary["main_continuity"] = int(frames["cont_main"].all())
+    # NaN means missing, which SQLite should see as NULL
+    return {key: None if value != value else value for key, value in summary.items()}
+
+# Reads a flight file as (log bytes, rom, config bytes, download time); CSVs
+# written by nanodeploy carry the log in their raw column, but no device info
+def read_flight_file(path: str) -> tuple[bytes, bytes | None, bytes | None, float | None]:
+    if path.lower().endswith(".csv"):
+        raw = load_csv(path, ["raw"])["raw"]
+        return bytes.fromhex("".join(raw)), None, None, None
+    try:
+        with image.FlightImage(path) as img:
+            return bytes(img.data), img.rom, img.config_bytes, img.downloaded
+    except ValueError:
+        # Not an image, so a bare EEPROM dump (see nanodeploy.RawSink)
+        with open(path, "rb") as f:
+            return f.read(), None, None, None
+
+class Archive:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    # Adds one flight. Returns its ID, or None if the same log from the same
+    # device is already archived.
+    def ingest_data(self, data: bytes, rom: bytes | None = None, config: bytes | None = None,
+                    source: str | None = None, downloaded: float | None = None) -> int | None:
+        data = bytes(data[:len(data) - len(data) % mem_per_packet])
+        digest = hashlib.sha256((rom or b'') + data).hexdigest()
+        row: dict[str, typing.Any] = {
+            "digest": digest, "source": source, "downloaded": downloaded,
+            "ingested": time.time(), "rom": None if rom is None else rom.hex()
+        }
+        dev_id = None if rom is None else DeviceID.from_bytes(rom)
+        if dev_id is not None:
+            row.update(device=dev_id.id, hwver=dev_id.hwver, fwver=dev_id.fwver)
+        dev_config = None if config is None else Config.from_bytes(config)
+        if dev_config is not None:
+            row.update(name=dev_config.name.rstrip("\0 "), base_pres=dev_config.base_pres)
+        row.update(flight_summary(data))
+        with self.db:
+            cur = self.db.execute(
+                f"INSERT OR IGNORE INTO flights ({', '.join(row)}) "
+                f"VALUES ({', '.join('?' * len(row))})", list(row.values()))
+            if cur.rowcount == 0:
+                return None
+            self.db.execute("INSERT INTO logs (flight, data) VALUES (?, ?)",
+                            (cur.lastrowid, zlib.compress(data)))
+        return cur.lastrowid
+
+    # Adds a flight image, CSV or bare EEPROM dump (see read_flight_file)
+    def ingest(self, path: str) -> int | None:
+        data, rom, config, downloaded = read_flight_file(path)
+        return self.ingest_data(data, rom, config, os.path.abspath(path), downloaded)
+
+    # Summary rows of the flights matching every given filter, oldest first
+    def find(self, device: int | None = None, name: str | None = None,
+             min_apogee: float | None = None, max_apogee: float | None = None,
+             since: float | None = None, until: float | None = None) -> list[sqlite3.Row]:
+        filters = [("device = ?", device), ("name = ?", name),
+                   ("apogee >= ?", min_apogee), ("apogee <= ?", max_apogee),
+                   ("downloaded >= ?", since), ("downloaded <= ?", until)]
+        used = [(clause, value) for clause, value in filters if value is not None]
+        where = " AND ".join(clause for clause, _ in used) or "1"
+        return self.db.execute(f"SELECT * FROM flights WHERE {where} ORDER BY downloaded, id",
+                               [value for _, value in used]).fetchall()
+
+    def data(self, flight: int) -> bytes:
+        row = self.db.execute("SELECT data FROM logs WHERE flight = ?", (flight,)).fetchone()
+        if row is None:
+            raise KeyError(flight)
+        return zlib.decompress(row["data"])
+
+    # Decoded frames of an archived flight (see nanodeploy.decode_frames)
+    def frames(self, flight: int):
+        return decode_frames(self.data(flight))
+
+    def remove(self, flight: int):
+        with self.db:
+            self.db.execute("DELETE FROM flights WHERE id = ?", (flight,))
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Archive of NanoDeploy flights."
+    )
+    parser.add_argument("database", help="SQLite archive file, created if missing")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Add flight images, CSVs or raw dumps")
+    ingest.add_argument("files", nargs='+')
+    find = commands.add_parser("find", help="List flights matching all the given filters")
+    find.add_argument("-d", "--device", type=int, default=None, help="Device ID number")
+    find.add_argument("-n", "--name", default=None, help="Device name")
+    find.add_argument("--min-apogee", type=float, default=None, help="Lowest apogee (m)")
+    find.add_argument("--max-apogee", type=float, default=None, help="Highest apogee (m)")
+    export = commands.add_parser("export", help="Write an archived flight to CSV, NPZ, Parquet or Arrow")
+    export.add_argument("flight", type=int)
+    export.add_argument("file")
+    args = parser.parse_args()
+    with Archive(args.database) as archive:
+        if args.command == "ingest":
+            added = 0
+            for path in args.files:
+                try:
+                    added += archive.ingest(path) is not None
+                except (OSError, ValueError) as e:
+                    print(f"Couldn't read {path}: {e}", file=sys.stderr)
+            print(f"Added {added} of {len(args.files)} flights")
+        elif args.command == "find":
+            print("id\tdevice\tname\tapogee (m)\tmax speed (m/s)\tsource")
+            for row in archive.find(args.device, args.name, args.min_apogee, args.max_apogee):
+                print(f"{row['id']}\t{row['device']}\t{row['name']}\t{row['apogee']}"
+                      f"\t{row['max_speed']}\t{row['source']}")
+        elif args.command == "export":
+            row = archive.db.execute("SELECT * FROM flights WHERE id = ?", (args.flight,)).fetchone()
+            if row is None:
+                print(f"No flight {args.flight}", file=sys.stderr)
+                exit(-1)
+            if args.file.lower().endswith(".csv"):
+                with open(args.file, "w") as f:
+                    CSVSink(f).write(archive.data(args.flight))
+            else:
+                metadata = {key: row[key] for key in ("rom", "hwver", "fwver", "name",
+                                                      "base_pres", "downloaded")
+                            if row[key] is not None}
+                if row["device"] is not None:
+                    metadata["id"] = row["device"]
+                image.export_columns(args.file, archive.frames(args.flight), metadata)
+
+if __name__ == "__main__":
+    main()
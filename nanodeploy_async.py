@@ -0,0 +1,216 @@
+import io
+import asyncio
+import time
+import typing
+from nano_owi_bridge import Batch, stats, owi_crc16
+from nano_owi_async import AsyncBridge, open_bridge
+from nanodeploy import (DEV_CMD_READ, DEV_CMD_WRITE, DEV_CMD_LOAD_CFG,
+                        DEV_CMD_MEASURE, DEV_CMD_LOAD_DATA, DEV_CMD_SAVE_CFG,
+                        DEV_CMD_CRC_DATA, DeviceID, DeviceTiming, PageCache, CSVSink,
+                        is_erased, log_extent, page_batch, crcs_per_command, crc_probe,
+                        mem_size, mem_per_packet, pages_per_batch)
+
+# asyncio versions of the device operations in nanodeploy. These never block
+# the event loop, so a long dump on one bridge doesn't stall work on others.
+
+# asyncio.sleep, counted in the bridge statistics
+async def sleep(seconds: float):
+    stats.record_sleep(seconds)
+    await asyncio.sleep(seconds)
+
+# Restarts the bus search and returns the first device's ROM, if any
+async def find_device(bridge: AsyncBridge) -> bytes | None:
+    batch = Batch()
+    batch.reset_scan()
+    found = batch.scan()
+    return (await bridge.run(batch, "scan"))[found]
+
+# Searches the whole bus and returns every device with a valid NanoDeploy ROM
+async def enumerate_devices(bridge: AsyncBridge) -> list[DeviceID]:
+    await bridge.cmd_reset_scan()
+    roms = []
+    while (rom := await bridge.cmd_scan()) is not None and rom not in roms:
+        roms.append(rom)
+    return [dev for dev in map(DeviceID.from_bytes, roms) if dev is not None]
+
+# Resets the bus and addresses one device (see nano_owi_bridge.cmd_select)
+async def select(bridge: AsyncBridge, rom: bytes | None = None) -> bool:
+    batch = Batch()
+    present = batch.select(rom)
+    return (await bridge.run(batch, "select"))[present]
+
+# See nanodeploy.wait_result
+async def wait_result(bridge: AsyncBridge, cmd: int, length: int, timing: DeviceTiming,
+                      valid: typing.Callable[[bytes], bool] | None = None,
+                      timeout: float = 1.0, rom: bytes | None = None) -> bytes:
+    if valid is None:
+        valid = lambda buf: not is_erased(buf)
+    start = time.monotonic()
+    await sleep(timing.expected(cmd))
+    interval = 0.001
+    first_poll = True
+    while True:
+        polled = time.monotonic() - start
+        batch = Batch()
+        batch.select(rom)
+        r = batch.read(DEV_CMD_READ, length)
+        buf = (await bridge.run(batch, "poll"))[r]
+        if valid(buf):
+            timing.record(cmd, polled, first_poll)
+            return buf
+        if time.monotonic() - start > timeout:
+            return buf
+        first_poll = False
+        await sleep(interval)
+        interval = min(interval * 2, 0.05)
+
+# Returns (pressure (Pa), altitude (m), temperature (unconverted))
+async def poll_sensors(bridge: AsyncBridge, timing: DeviceTiming | None = None,
+                       rom: bytes | None = None) -> tuple[int, int, int]:
+    if rom is not None:
+        await select(bridge, rom)
+    await bridge.cmd_write(DEV_CMD_MEASURE, b'')
+    if timing is None:
+        await sleep(0.25)
+        buf = await bridge.cmd_read(DEV_CMD_READ, 64)
+    else:
+        buf = await wait_result(bridge, DEV_CMD_MEASURE, 64, timing, rom=rom)
+    return (int.from_bytes(buf[0:4], 'little'),
+            int.from_bytes(buf[4:6], 'little'),
+            int.from_bytes(buf[6:8], 'little'))
+
+async def read_config(bridge: AsyncBridge, timing: DeviceTiming | None = None,
+                      rom: bytes | None = None) -> bytes:
+    if rom is not None:
+        await select(bridge, rom)
+    await bridge.cmd_write(DEV_CMD_LOAD_CFG, b'')
+    if timing is None:
+        await sleep(0.001)
+        return await bridge.cmd_read(DEV_CMD_READ, 64)
+    return await wait_result(bridge, DEV_CMD_LOAD_CFG, 64, timing, rom=rom)
+
+async def write_config(bridge: AsyncBridge, buffer: bytes, rom: bytes | None = None):
+    batch = Batch()
+    if rom is not None:
+        batch.select(rom)
+    batch.write(DEV_CMD_WRITE, buffer)
+    batch.write(DEV_CMD_SAVE_CFG, b'')
+    await bridge.run(batch, "config")
+
+# See nanodeploy.reload_page
+async def reload_page(bridge: AsyncBridge, page: int, timing: DeviceTiming,
+                      rom: bytes | None = None) -> bytes:
+    await select(bridge, rom)
+    await bridge.cmd_write(DEV_CMD_LOAD_DATA, (page*64).to_bytes(2, 'little'))
+    return await wait_result(bridge, DEV_CMD_LOAD_DATA, 64, timing,
+                             timeout=2*timing.expected(DEV_CMD_LOAD_DATA), rom=rom)
+
+# See nanodeploy.read_page_list
+async def read_page_list(bridge: AsyncBridge, pages: list[int],
+                         timing: DeviceTiming | None = None, rom: bytes | None = None,
+                         trailing: bool = True) -> list[bytes]:
+    batch, reads = page_batch(pages, rom)
+    results = await bridge.run(batch, "page")
+    bufs = [results[r] for r in reads]
+    if timing is not None:
+        last = max((i for i, buf in enumerate(bufs) if not is_erased(buf)), default=-1)
+        for i, buf in enumerate(bufs):
+            if is_erased(buf) and (i < last or trailing):
+                bufs[i] = await reload_page(bridge, pages[i], timing, rom)
+    return bufs
+
+async def read_pages(bridge: AsyncBridge, start: int, count: int,
+                     timing: DeviceTiming | None = None, rom: bytes | None = None,
+                     trailing: bool = True) -> bytes:
+    return b''.join(await read_page_list(bridge, list(range(start, start + count)),
+                                         timing, rom, trailing))
+
+# See nanodeploy.read_crcs
+async def read_crcs(bridge: AsyncBridge, start: int, timing: DeviceTiming,
+                    rom: bytes | None = None) -> dict[int, int] | None:
+    batch = Batch()
+    batch.select(rom)
+    batch.write(DEV_CMD_WRITE, crc_probe)
+    batch.write(DEV_CMD_CRC_DATA, (start*64).to_bytes(2, 'little'))
+    await bridge.run(batch, "crc")
+    buf = await wait_result(bridge, DEV_CMD_CRC_DATA, 2*crcs_per_command, timing,
+                            valid=lambda buf: not is_erased(buf) and buf != crc_probe,
+                            timeout=2*DeviceTiming.defaults[DEV_CMD_CRC_DATA], rom=rom)
+    if buf == crc_probe:
+        return None
+    if is_erased(buf):
+        return {}
+    return {start + i: int.from_bytes(buf[2*i:2*i+2], 'little')
+            for i in range(crcs_per_command) if start + i < mem_size//64}
+
+# See nanodeploy.read_pages_cached
+async def read_pages_cached(bridge: AsyncBridge, cache: PageCache, crcs: dict[int, int],
+                            start: int, count: int, timing: DeviceTiming | None = None,
+                            rom: bytes | None = None, trailing: bool = True) -> bytes:
+    pages = [cache.page(p) if p in crcs and cache.crc(p) == crcs[p] else None
+             for p in range(start, start + count)]
+    missing = [start + i for i, buf in enumerate(pages) if buf is None]
+    for page, buf in zip(missing, await read_page_list(bridge, missing, timing, rom, trailing)):
+        pages[page - start] = buf
+        if crcs.get(page, owi_crc16(buf)) == owi_crc16(buf):
+            cache.store(page, buf)
+    return b''.join(pages)
+
+# See nanodeploy.iter_pages
+async def iter_pages(bridge: AsyncBridge, timing: DeviceTiming | None = None,
+                     rom: bytes | None = None, full: bool = False,
+                     cache: PageCache | None = None) -> typing.AsyncIterator[bytes]:
+    prev = None
+    crcs: dict[int, int] = {}
+    if cache is not None and timing is None:
+        timing = DeviceTiming()
+    for start in range(0, mem_size//64, pages_per_batch):
+        count = min(pages_per_batch, mem_size//64 - start)
+        if cache is not None and start not in crcs:
+            block = await read_crcs(bridge, start, timing, rom)
+            if block is None:
+                cache = None
+            else:
+                crcs = block
+        if cache is None:
+            chunk = await read_pages(bridge, start, count, timing, rom, trailing=full)
+        else:
+            chunk = await read_pages_cached(bridge, cache, crcs, start, count, timing, rom,
+                                            trailing=full)
+        used = len(chunk) if full else log_extent(chunk, start, prev)
+        while (timing is not None and used < len(chunk) and used % 64 == 0
+               and is_erased(chunk[used:used+64])):
+            page = start + used//64
+            buf = await reload_page(bridge, page, timing, rom)
+            if is_erased(buf):
+                break
+            chunk = chunk[:used] + buf + chunk[used+64:]
+            if cache is not None and crcs.get(page, owi_crc16(buf)) == owi_crc16(buf):
+                cache.store(page, buf)
+            used = log_extent(chunk, start, prev)
+        if cache is not None:
+            cache.save()
+        if used > 0:
+            yield chunk[:used]
+        if used < len(chunk):
+            return
+        prev = chunk[-mem_per_packet:]
+
+# See nanodeploy.dump_data
+async def dump_data(bridge: AsyncBridge, sink: typing.Any, timing: DeviceTiming | None = None,
+                    rom: bytes | None = None,
+                    progress: typing.Callable[[int], None] | None = None,
+                    full: bool = False, cache: PageCache | None = None) -> int:
+    received = 0
+    async for chunk in iter_pages(bridge, timing, rom, full, cache):
+        sink.write(chunk)
+        received += len(chunk)
+        if progress is not None:
+            progress(received)
+    return received
+
+async def read_data(bridge: AsyncBridge, timing: DeviceTiming | None = None,
+                    rom: bytes | None = None) -> str:
+    out = io.StringIO()
+    await dump_data(bridge, CSVSink(out), timing, rom)
+    return out.getvalue()
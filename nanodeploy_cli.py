@@ -1,4 +1,5 @@
 #!/usr/bin/python3
+import json
 import typing
 import serial
 import serial.serialutil
@@ -6,6 +7,9 @@ import argparse
 
 
 import nano_owi_bridge as owi
+import nanodeploy_fleet as fleet
+import nano_owi_emulator as emulator
+import nanodeploy_image as image
 from nanodeploy import *
 
 def getval(msg: str, func: typing.Callable, default: typing.Any = None, onfail: None | str = None) -> typing.Any:
@@ -37,19 +41,27 @@ def cmd_list(*_: list[str]):
         print(config)
 
 def cmd_port(*args: str):
-    global port
+    global port, session
     if len(args) < 1:
         print("Not enough arguments to port command")
         return
+    if args[0] == "emulator":
+        # Stand-in bridge with a single freshly configured device, for trying
+        # things out without hardware
+        port = emulator.EmulatedBridge([emulator.EmulatedDevice.make_default(1)])
+        session = DeviceSession(port)
+        print("Using emulated bridge")
+        return
     try:
         port = serial.Serial(args[0], 115200)
+        session = DeviceSession(port)
         print(f"Using port {args[0]}")
     except serial.serialutil.SerialException:
         print(f"Couldn't open port {args[0]}")
             
 def write_default(dev_id: DeviceID, name: str):
     default_config = Config.make_default(dev_id, name)
-    write_config(port, bytes(default_config))
+    session.write_config(default_config)
 
 def prompt_id(prev: DeviceID = None) -> DeviceID:
     if prev is not None:
@@ -62,22 +74,131 @@ def prompt_id(prev: DeviceID = None) -> DeviceID:
         id = getval("ID number?", int)
     return DeviceID(hwver, fwver, id)
 
+def print_progress(received: int):
+    print(f"\rDownloaded {received}/{mem_size} bytes", end="", flush=True)
+
 def cmd_dump(*args: str):
     if len(args) < 1:
         print("Not enough arguments to dump command")
         return
     cmd_read()
+    if config is None:
+        return
     with open(args[0], "w") as f:
-        f.write(read_data(port))
-    print(f"Wrote data to {args[0]}")
+        session.dump_data(CSVSink(f), print_progress, cache=PageCache(config.id))
+    print(f"\nWrote data to {args[0]}")
+
+def cmd_image(*args: str):
+    if len(args) < 1:
+        print("Not enough arguments to image command")
+        return
+    cmd_read()
+    if config is None:
+        return
+    full = len(args) > 1 and args[1] == "full"
+    with open(args[0], "wb") as f:
+        session.dump_data(image.ImageSink(f, bytes(config.id), session.config_bytes),
+                          print_progress, full, PageCache(config.id))
+    print(f"\nWrote flight image to {args[0]}")
+
+def cmd_convert(*args: str):
+    if len(args) < 2:
+        print("Not enough arguments to convert command")
+        return
+    try:
+        with image.FlightImage(args[0]) as img:
+            if args[1].lower().endswith(".csv"):
+                with open(args[1], "w") as f:
+                    img.write_csv(f)
+            else:
+                img.export(args[1])
+    except ImportError as e:
+        print(f"Exporting to {args[1]} needs {e.name}")
+        return
+    except (OSError, ValueError) as e:
+        print(f"Couldn't convert {args[0]}: {e}")
+        return
+    print(f"Wrote data to {args[1]}")
+
+def cmd_dump_all(*args: str):
+    if len(args) < 1:
+        print("Not enough arguments to dumpall command")
+        return
+    if port is None:
+        print("Please select a port first")
+        return
+    for dev_id in enumerate_devices(port):
+        rom = bytes(dev_id)
+        dev_config = Config.from_bytes(read_config(port, timing_for(rom), rom))
+        if dev_config is None:
+            print(f"Device {dev_id} has an invalid configuration, skipping")
+            continue
+        fname = f"{args[0]}{dev_id.id}.csv"
+        with open(fname, "w") as f:
+            dump_data(port, CSVSink(f), timing_for(rom), rom, print_progress,
+                      cache=PageCache(dev_id))
+        print()
+        print(f"Wrote data from {dev_config.name} {dev_id} to {fname}")
+
+def cmd_fleet(*args: str):
+    if len(args) < 2:
+        print("Not enough arguments to fleet command")
+        return
+    ports = fleet.expand_ports(list(args[1:]))
+    if len(ports) == 0:
+        print("No ports matched")
+        return
+    fleet.dump_fleet(ports, args[0])
+
+def cmd_stats(*args: str):
+    if len(args) < 1:
+        print(owi.stats)
+    elif args[0] == "reset":
+        owi.stats.reset()
+        print("Cleared transfer statistics")
+    else:
+        with open(args[0], "w") as f:
+            json.dump(owi.stats.to_json(), f, indent=2)
+        print(f"Wrote transfer statistics to {args[0]}")
+
+def cmd_scan(*_: list[str]):
+    global devices
+    if port is None:
+        print("Please select a port first")
+        return
+    devices = enumerate_devices(port)
+    if len(devices) == 0:
+        print("No devices found")
+    for dev_id in devices:
+        print(f"{dev_id.id}\t{dev_id}")
+
+def cmd_select(*args: str):
+    global session
+    if port is None:
+        print("Please select a port first")
+        return
+    if len(args) < 1:
+        session = DeviceSession(port)
+        print("Using the first device found on the bus")
+        return
+    try:
+        num = int(args[0])
+    except ValueError:
+        print("Device ID must be a number")
+        return
+    matches = [dev_id for dev_id in devices if dev_id.id == num]
+    if len(matches) == 0:
+        print(f"No device with ID {num} found, try scanning first")
+        return
+    session = DeviceSession(port, bytes(matches[0]))
+    print(f"Selected device {matches[0]}")
 
 def cmd_read(*_: list[str]):
     global config
-    if port is None:
+    if session is None:
         print("Please select a port first")
         return
-    owi.cmd_reset_scan(port)
-    owi_id = owi.cmd_scan(port)
+    owi_id = session.connect()
     if owi_id is None:
         print("No device found")
         return
@@ -93,7 +214,7 @@ def cmd_read(*_: list[str]):
         id = getval("ID number?", int)
         name = getval("Name?", str)
         write_default(DeviceID(hwver, fwver, id), name)
-    new_config = Config.from_bytes(read_config(port))
+    new_config = session.read_config(refresh=True)
     if new_config is None:
         if dev_id is not None:
             print(f"Device {owi_id} is a NanoDeploy but its configuration is invalid")
@@ -103,7 +224,7 @@ def cmd_read(*_: list[str]):
                 return
             name = getval("Name?", str)
             write_default(dev_id, name)
-            new_config = Config.from_bytes(read_config(port))
+            new_config = session.read_config(refresh=True)
     if new_config is None:
         print("Failed to write default config!")
         return
@@ -112,18 +233,15 @@ def cmd_read(*_: list[str]):
     print(config)
 
 def cmd_write(*_: list[str]):
-    if port is None:
+    if session is None:
         print("Please select a serial port")
         return
     if config is None:
         print("Please load a configuration first")
         return
-    owi.cmd_reset_scan(port)
-    owi_id = owi.cmd_scan(port)
-    if owi_id is None:
+    if not session.write_config(config):
         print("No device found")
         return
-    write_config(port, bytes(config))
     print("Saved configuration to device")
 
 def cmd_set_id(*_: list[str]):
@@ -185,8 +303,15 @@ commands: dict[str, tuple[str, typing.Callable[..., None]]] = {
     "help": ("Prints this help file", cmd_help),
     "quit": ("Exits CLI", cmd_quit),
     "list": ("Prints the currently loaded configuration", cmd_list),
-    "port": ("Selects a serial port to search on", cmd_port),
+    "port": ("Selects a serial port to search on (\"emulator\" for a simulated device)", cmd_port),
     "dump": ("Downloads flight data to a CSV file", cmd_dump),
+    "image": ("Downloads flight data to a raw image file (add 'full' for the whole memory)", cmd_image),
+    "convert": ("Converts a raw image file to CSV, NPZ, Parquet or Arrow by extension: convert <image> <file>", cmd_convert),
+    "dumpall": ("Downloads flight data from every device to <prefix><id>.csv", cmd_dump_all),
+    "fleet": ("Downloads every device on many ports at once: fleet <dir> <ports/globs...>", cmd_fleet),
+    "scan": ("Lists every device on the bus", cmd_scan),
+    "stats": ("Prints transfer statistics, writes them to a JSON file, or clears them with 'reset'", cmd_stats),
+    "select": ("Selects a device by ID number for later commands", cmd_select),
     "read": ("Reads configuration data from the device", cmd_read),
     "write": ("Writes configuration data to the device", cmd_write),
     "default": ("Resets the current config to default values", cmd_default),
@@ -198,7 +323,9 @@ commands: dict[str, tuple[str, typing.Callable[..., None]]] = {
 }
 
 port: serial.Serial = None
+session: DeviceSession = None
 config: Config = None
+devices: list[DeviceID] = []
 
 def handle_cmd(inp: str):
     cmd, *args = inp.split()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+import os
+import json
+import glob
+import time
+import argparse
+import concurrent.futures
+import serial
+import serial.serialutil
+
+from nanodeploy import *
+import nanodeploy_image as image
+
+# Expands any glob patterns (e.g. /dev/ttyACM*) in a list of serial ports
+def expand_ports(patterns: list[str]) -> list[str]:
+    ports = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        ports += [p for p in matches if p not in ports]
+    return ports
+
+# Downloads every device on one bridge into outdir as
+# <port>-<hwver>-<fwver>-<id>.csv, or .ndi flight images if as_image is set,
+# fetching only pages changed since the last download if cache is set. The
+# port keeps apart the files and page caches of devices with the same ROM on
+# different bridges. Returns (port, device, output file, bytes read, error)
+# per device; the file is None for a device that was skipped or failed, and
+# the error is None unless it failed. A device that fails doesn't stop the rest of the bus.
+def dump_port(port_name: str, outdir: str, cache: bool = True,
+              as_image: bool = False) -> list[tuple[str, DeviceID, str | None, int, str | None]]:
+    results = []
+    with serial.Serial(port_name, 115200, timeout=2) as port:
+        for dev_id in enumerate_devices(port):
+            rom = bytes(dev_id)
+            timing = timing_for(rom)
+            prefix = f"{os.path.basename(port_name)}-"
+            fname = os.path.join(outdir, f"{prefix}{dev_id.hwver}-{dev_id.fwver}-{dev_id.id}."
+                                         f"{'ndi' if as_image else 'csv'}")
+            nbytes = 0
+            try:
+                config_bytes = read_config(port, timing, rom)
+                nbytes = 64
+                if Config.from_bytes(config_bytes) is None:
+                    results.append((port_name, dev_id, None, nbytes, None))
+                    continue
+                with open(fname, "wb" if as_image else "w") as f:
+                    sink = image.ImageSink(f, rom, config_bytes) if as_image else CSVSink(f)
+                    nbytes += dump_data(port, sink, timing, rom,
+                                        cache=PageCache(dev_id, prefix=prefix) if cache else None)
+            except (serial.serialutil.SerialException, IndexError, OSError) as e:
+                # Don't leave a partial download looking like a whole one
+                if os.path.exists(fname):
+                    os.remove(fname)
+                results.append((port_name, dev_id, None, nbytes, str(e) or type(e).__name__))
+                continue
+            results.append((port_name, dev_id, fname, nbytes, None))
+    return results
+
+# Dumps all ports concurrently, one thread per bridge, and prints a summary
+def dump_fleet(ports: list[str], outdir: str, workers: int | None = None,
+               cache: bool = True, as_image: bool = False):
+    os.makedirs(outdir, exist_ok=True)
+    start = time.monotonic()
+    total_bytes = 0
+    devices = 0
+    with concurrent.futures.ThreadPoolExecutor(workers or len(ports) or 1) as pool:
+        futures = {pool.submit(dump_port, p, outdir, cache, as_image): p for p in ports}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results = future.result()
+            except (serial.serialutil.SerialException, IndexError) as e:
+                print(f"{futures[future]}: failed ({e})")
+                continue
+            if len(results) == 0:
+                print(f"{futures[future]}: no devices found")
+            for port_name, dev_id, fname, nbytes, error in results:
+                total_bytes += nbytes
+                if error is not None:
+                    print(f"{port_name}: {dev_id} failed ({error})")
+                elif fname is None:
+                    print(f"{port_name}: {dev_id} has an invalid configuration, skipped")
+                else:
+                    devices += 1
+                    print(f"{port_name}: wrote {dev_id} to {fname}")
+    elapsed = time.monotonic() - start
+    print(f"Downloaded {devices} devices from {len(ports)} ports, "
+          f"{total_bytes} bytes in {elapsed:.2f} s ({total_bytes / max(elapsed, 1e-6):.0f} B/s)")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Downloads flight data from many NanoDeploy bridges at once."
+    )
+    parser.add_argument("ports", nargs='+', help="Serial ports or glob patterns, e.g. /dev/ttyACM*")
+    parser.add_argument("-o", "--outdir", default=".", help="Directory to write one file per device to")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Maximum number of ports to download at once")
+    parser.add_argument("-i", "--image", action="store_true", help="Write raw flight images (.ndi) instead of CSV")
+    parser.add_argument("-n", "--no-cache", action="store_true", help="Download every page instead of only those changed since the last download")
+    parser.add_argument("-s", "--stats", default=None, help="Write transfer statistics to this JSON file")
+    args = parser.parse_args()
+    ports = expand_ports(args.ports)
+    if len(ports) == 0:
+        print("No ports matched")
+        exit(-1)
+    dump_fleet(ports, args.outdir, args.jobs, not args.no_cache, args.image)
+    if args.stats is not None:
+        with open(args.stats, "w") as f:
+            json.dump(stats.to_json(), f, indent=2)
+
+if __name__ == "__main__":
+    main()
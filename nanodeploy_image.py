@@ -0,0 +1,206 @@
+import io
+import os
+import json
+import mmap
+import time
+import struct
+import typing
+
+from nanodeploy import (DeviceID, Config, CSVSink, decode_frames, frame_dtype,
+                        mem_per_packet, pack_columns, load_csv)
+
+# Raw flight images: a small header followed by the EEPROM bytes exactly as
+# downloaded, from address 0 to the end of the file. About 1/10 the size of the
+# CSV (8 bytes a frame against about 77), and frames can be read straight out
+# of the file without parsing.
+#
+# Header (little-endian):
+#   magic       4s   b"NDFI"
+#   version     u16  IMAGE_VERSION
+#   data offset u16  size of the header, where the EEPROM bytes start
+#   downloaded  f64  download time (Unix time)
+#   rom         8s   DeviceID of the device
+#   config      64s  raw config segment of the device
+IMAGE_MAGIC = b"NDFI"
+IMAGE_VERSION = 1
+IMAGE_HEADER = struct.Struct("<4sHHd8s64s")
+
+# Sink (see nanodeploy.dump_data) that writes an image to an open binary file
+class ImageSink:
+    def __init__(self, file: typing.BinaryIO, rom: bytes, config: bytes,
+                 downloaded: float | None = None):
+        self.file = file
+        if downloaded is None:
+            downloaded = time.time()
+        self.file.write(IMAGE_HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, IMAGE_HEADER.size,
+                                          downloaded, bytes(rom), bytes(config)))
+
+    def write(self, chunk: bytes):
+        self.file.write(chunk)
+        self.file.flush()
+
+# Per-file metadata stored alongside exported columns
+def flight_metadata(rom: bytes, config_bytes: bytes, downloaded: float | None = None) -> dict[str, typing.Any]:
+    metadata: dict[str, typing.Any] = {"rom": bytes(rom).hex()}
+    dev_id = DeviceID.from_bytes(rom)
+    if dev_id is not None:
+        metadata.update(hwver=dev_id.hwver, fwver=dev_id.fwver, id=dev_id.id)
+    config = Config.from_bytes(config_bytes)
+    if config is not None:
+        metadata.update(name=config.name.rstrip("\0 "), base_pres=config.base_pres)
+    if downloaded is not None:
+        metadata["downloaded"] = downloaded
+    return metadata
+
+def write_image(path: str, rom: bytes, config: bytes, data: bytes,
+                downloaded: float | None = None):
+    with open(path, "wb") as f:
+        ImageSink(f, rom, config, downloaded).write(data)
+
+# A flight image on disk. Opening one only reads the header; the file is
+# memory-mapped the first time its data is used, and everything derived from
+# it is computed on demand.
+class FlightImage:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(IMAGE_HEADER.size)
+        if len(header) < IMAGE_HEADER.size:
+            raise ValueError(f"{path} is too short to be a flight image")
+        magic, version, self.offset, self.downloaded, self.rom, self.config_bytes = \
+            IMAGE_HEADER.unpack(header)
+        if magic != IMAGE_MAGIC:
+            raise ValueError(f"{path} is not a flight image")
+        if version > IMAGE_VERSION:
+            raise ValueError(f"{path} is image version {version}, newer than this tool")
+        self.size = os.path.getsize(path) - self.offset
+        self._map: mmap.mmap | None = None
+        self._decoded = None
+
+    @property
+    def dev_id(self) -> DeviceID | None:
+        return DeviceID.from_bytes(self.rom)
+
+    # None if the config segment was invalid when downloaded
+    @property
+    def config(self) -> Config | None:
+        return Config.from_bytes(self.config_bytes)
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    # The EEPROM bytes, without copying them
+    @property
+    def data(self) -> memoryview:
+        return memoryview(self._mapped())[self.offset:self.offset + self.size]
+
+    # Raw frames (see nanodeploy.frame_dtype) as a read-only view of the file
+    @property
+    def frames(self):
+        import numpy as np
+        return np.frombuffer(self._mapped(), dtype=frame_dtype(),
+                             count=self.size // mem_per_packet, offset=self.offset)
+
+    # Frames converted as by nanodeploy.decode_frames, computed once
+    def decoded(self):
+        if self._decoded is None:
+            self._decoded = decode_frames(self.frames)
+        return self._decoded
+
+    @property
+    def metadata(self) -> dict[str, typing.Any]:
+        return flight_metadata(self.rom, self.config_bytes, self.downloaded)
+
+    # See export_columns
+    def export(self, path: str):
+        export_columns(path, self.decoded(), self.metadata)
+
+    def write_csv(self, file: typing.TextIO):
+        CSVSink(file).write(self.data)
+
+    def to_csv(self) -> str:
+        out = io.StringIO()
+        self.write_csv(out)
+        return out.getvalue()
+
+    # Views of the data may still be in use elsewhere, in which case the
+    # mapping stays open until they are gone
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+            self._map = None
+        self._decoded = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+# Columnar exports of decoded frames (see nanodeploy.decode_frames): one typed
+# column per field, plus the metadata dict. The format follows the extension:
+# .npz needs only NumPy, while .parquet and .arrow/.feather need pyarrow.
+export_formats = [".npz", ".parquet", ".arrow", ".feather"]
+
+def _arrow_table(frames, metadata: dict[str, typing.Any]):
+    import pyarrow as pa
+    table = pa.table({name: frames[name] for name in frames.dtype.names})
+    return table.replace_schema_metadata({"nanodeploy": json.dumps(metadata)})
+
+def export_columns(path: str, frames, metadata: dict[str, typing.Any]):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npz":
+        import numpy as np
+        with open(path, "wb") as f:
+            np.savez(f, metadata=np.array(json.dumps(metadata)),
+                     **{name: frames[name] for name in frames.dtype.names})
+    elif ext == ".parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(_arrow_table(frames, metadata), path)
+    elif ext in (".arrow", ".feather"):
+        import pyarrow.feather as feather
+        feather.write_feather(_arrow_table(frames, metadata), path)
+    else:
+        raise ValueError(f"Unknown export format {ext}, expected one of {', '.join(export_formats)}")
+
+# Reads an export back as (frames, metadata), frames being a structured array
+# like the one decode_frames returns
+def load_columns(path: str) -> tuple[typing.Any, dict[str, typing.Any]]:
+    import numpy as np
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npz":
+        with np.load(path) as f:
+            metadata = json.loads(str(f["metadata"]))
+            columns = {name: f[name] for name in f.files if name != "metadata"}
+    elif ext in (".parquet", ".arrow", ".feather"):
+        if ext == ".parquet":
+            import pyarrow.parquet as pq
+            table = pq.read_table(path)
+        else:
+            import pyarrow.feather as feather
+            table = feather.read_table(path)
+        metadata = json.loads((table.schema.metadata or {}).get(b"nanodeploy", b"{}"))
+        columns = {name: table.column(name).to_numpy() for name in table.column_names}
+    else:
+        raise ValueError(f"Unknown export format {ext}, expected one of {', '.join(export_formats)}")
+    return pack_columns(columns), metadata
+
+# Loads decoded frames from any flight file: a flight image, a columnar export
+# or a CSV, by extension. Fields are named as in decode_frames, except for CSVs,
+# which keep their column names.
+def load_flight(path: str, columns: list[str] | None = None):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return load_csv(path, columns)
+    if ext in export_formats:
+        frames, _ = load_columns(path)
+    else:
+        with FlightImage(path) as img:
+            frames = img.decoded()
+    return frames if columns is None else pack_columns({name: frames[name] for name in columns})